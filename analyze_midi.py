@@ -1,6 +1,9 @@
 import sys
 
 import mido
+import numpy as np
+
+from transpose_fit import TransposeFit, pitch_histogram
 
 
 def analyze(file_path):
@@ -10,23 +13,21 @@ def analyze(file_path):
         print(f"Error opening {file_path}: {e}")
         return
 
-    notes = []
-
     print(f"--- Analyzing {file_path} ---")
-    for msg in mid:
-        if msg.type == "note_on" and msg.velocity > 0:
-            notes.append(msg.note)
+    hist = pitch_histogram(mid)
+    total = int(hist.sum())
 
-    if not notes:
+    if total == 0:
         print("No notes found!")
         return
 
-    min_note = min(notes)
-    max_note = max(notes)
-    avg_note = sum(notes) / len(notes)
+    present = np.flatnonzero(hist)
+    min_note = int(present[0])
+    max_note = int(present[-1])
+    avg_note = float((np.arange(128) * hist).sum() / total)
     print(f"Average Note: {avg_note:.2f}")
 
-    print(f"Total Notes: {len(notes)}")
+    print(f"Total Notes: {total}")
     print(
         f"Lowest Note: {min_note} ({mido.format_as_string(mido.Message('note_on', note=min_note))})"
     )
@@ -35,31 +36,33 @@ def analyze(file_path):
     )
 
     # Check overlap with our mapping (48 to 84)
-    mapped_count = sum(1 for n in notes if 48 <= n <= 84)
+    mapped_count = int(hist[48:85].sum())
     print(
-        f"Notes in mapped range (48-84): {mapped_count} ({mapped_count / len(notes) * 100:.1f}%)"
+        f"Notes in mapped range (48-84): {mapped_count} ({mapped_count / total * 100:.1f}%)"
     )
 
-    # Suggest transposition
-    # We want to maximize overlap with 48-84
-    # Simple brute force optimal shift
-    best_shift = 0
-    best_coverage = 0
-
-    # Check shifts from -24 to +24
-    for shift in range(-36, 36):
-        count = sum(1 for n in notes if 48 <= (n + shift) <= 84)
-        if count > best_coverage:
-            best_coverage = count
-            best_shift = shift
-
-    print(
-        f"Suggested Transpose: {best_shift} (Coverage: {best_coverage / len(notes) * 100:.1f}%)"
-    )
+    # Score every shift for every layout at once, folding included
+    for layout in ("keyboard", "guitar", "drums"):
+        fit = TransposeFit(hist, layout)
+        now = fit.at(0)
+        best = fit.best()
+        i = fit.at(best)
+        print(
+            f"[{layout}] As is: playable {fit.playable[now] / total * 100:.1f}%, "
+            f"fold collisions {fit.collisions[now]}, lost {fit.lost[now]}"
+        )
+        print(
+            f"[{layout}] Suggested Transpose: {best:+d} "
+            f"(Coverage: {fit.in_window[i] / total * 100:.1f}% in range, "
+            f"{fit.playable[i] / total * 100:.1f}% playable, "
+            f"{fit.white[i] / total * 100:.1f}% white keys, "
+            f"fold collisions {fit.collisions[i]}, lost {fit.lost[i]})"
+        )
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python analyze_midi.py <file.mid>")
+        print("Usage: python analyze_midi.py <file.mid> [more.mid ...]")
     else:
-        analyze(sys.argv[1])
+        for path in sys.argv[1:]:
+            analyze(path)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Injection benchmark: sends keys through each x_injection backend to a test
+window on a throwaway Xvfb server (or an existing display) and measures
+per-event latency (key queued -> event received by the window's client) and
+burst throughput, as JSON.
+
+    uv run --with python-xlib bench_injection.py
+    uv run --with python-xlib bench_injection.py --backend sendevent xtest --events 5000
+    uv run --with python-xlib bench_injection.py --display :101 -o inject.json
+
+Run it against the instance's own display (Xephyr) to pick the backend for
+that instance; Xvfb is the stand-in when no instance is running.
+"""
+
+import argparse
+import json
+import os
+import select
+import shutil
+import subprocess
+import sys
+import time
+
+from Xlib import X, display
+
+from benchmark import git_revision
+from latency import format_percentiles, percentile
+from x_injection import INJECTION_BACKENDS, make_injector
+
+# "a": Linux KEY_A (30) + 8
+TEST_KEYCODE = 38
+# Seconds to wait for an injected event before counting it as lost
+RECEIVE_TIMEOUT = 1.0
+
+
+def start_xvfb() -> tuple[subprocess.Popen, str]:
+    """Starts Xvfb on a free display number and waits until it accepts clients."""
+    if shutil.which("Xvfb") is None:
+        print("Error: Xvfb not found. Install it or pass --display.")
+        sys.exit(1)
+    read_fd, write_fd = os.pipe()
+    # -displayfd: Xvfb picks a free number and writes it once it is ready
+    server = subprocess.Popen(
+        ["Xvfb", "-displayfd", str(write_fd), "-nolisten", "tcp"],
+        pass_fds=(write_fd,),
+        stderr=subprocess.DEVNULL,
+    )
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        number = f.readline().strip()
+    if not number:
+        server.kill()
+        print("Error: Xvfb did not start.")
+        sys.exit(1)
+    return server, f":{number}"
+
+
+class Receiver:
+    """The stand-in game: a focused window on its own connection."""
+
+    def __init__(self, display_name: str):
+        self.display = display.Display(display_name)
+        root = self.display.screen().root
+        self.window = root.create_window(
+            0,
+            0,
+            100,
+            100,
+            0,
+            X.CopyFromParent,
+            event_mask=X.KeyPressMask | X.KeyReleaseMask,
+        )
+        self.window.set_wm_name("Heartopia")
+        self.window.map()
+        self.display.sync()
+        # XTEST input goes to the focus
+        self.window.set_input_focus(X.RevertToParent, X.CurrentTime)
+        self.display.sync()
+        self.synthetic = 0
+
+    def wait_key(self, deadline: float) -> bool:
+        """Blocks until one key event arrives (or the deadline passes)."""
+        d = self.display
+        while True:
+            while d.pending_events():
+                ev = d.next_event()
+                if ev.type in (X.KeyPress, X.KeyRelease):
+                    if ev.send_event:
+                        self.synthetic += 1
+                    return True
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            select.select([d.fileno()], [], [], remaining)
+
+    def close(self) -> None:
+        self.window.destroy()
+        self.display.close()
+
+
+def run_backend(display_name: str, backend: str, events: int, burst: int) -> dict:
+    receiver = Receiver(display_name)
+    try:
+        sender = display.Display(display_name)
+        try:
+            injector = make_injector(backend, sender)
+            window = sender.create_resource_object("window", receiver.window.id)
+            delivers = backend != "null"
+
+            # Latency: one event at a time, flushed, until the window's client has it
+            latency = []
+            lost = 0
+            for n in range(events):
+                start = time.perf_counter()
+                injector.key(window, TEST_KEYCODE, 1 - n % 2)
+                injector.flush()
+                deadline = time.perf_counter() + RECEIVE_TIMEOUT
+                if delivers and not receiver.wait_key(deadline):
+                    lost += 1
+                    continue
+                latency.append(time.perf_counter() - start)
+
+            # Throughput: bursts of `burst` events per flush, like a chord per frame
+            received = 0
+            start = time.perf_counter()
+            for n in range(events):
+                injector.key(window, TEST_KEYCODE, 1 - n % 2)
+                if n % burst == burst - 1:
+                    injector.flush()
+            injector.flush()
+            if delivers:
+                deadline = time.perf_counter() + RECEIVE_TIMEOUT + events / 1000
+                while received < events and receiver.wait_key(deadline):
+                    received += 1
+            else:
+                received = events
+            wall = time.perf_counter() - start
+
+            synthetic = receiver.synthetic
+        finally:
+            sender.close()
+    finally:
+        # Also when make_injector fails and main moves on to the next backend
+        receiver.close()
+
+    latency.sort()
+    print(f"  {backend}: {format_percentiles(latency)}", file=sys.stderr)
+    return {
+        "backend": backend,
+        "events": events,
+        "burst": burst,
+        "latency_ms": {
+            "p50": percentile(latency, 50) * 1000,
+            "p95": percentile(latency, 95) * 1000,
+            "p99": percentile(latency, 99) * 1000,
+            "max": percentile(latency, 100) * 1000,
+        },
+        "lost": lost + events - received,
+        "throughput_events_per_s": received / wall if wall > 0 else 0.0,
+        # Events the client saw flagged as XSendEvent (some games ignore those)
+        "synthetic": synthetic,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark X key injection backends.")
+    parser.add_argument(
+        "--backend",
+        nargs="+",
+        choices=INJECTION_BACKENDS,
+        default=list(INJECTION_BACKENDS),
+    )
+    parser.add_argument(
+        "--events", type=int, default=2000, help="Key events per backend and test"
+    )
+    parser.add_argument(
+        "--burst", type=int, default=4, help="Events per flush in the throughput test"
+    )
+    parser.add_argument(
+        "--display",
+        default=None,
+        help="Use this display instead of starting Xvfb (e.g. an instance's Xephyr)",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="Write JSON results here (default: stdout)"
+    )
+    args = parser.parse_args()
+
+    server = None
+    if args.display:
+        display_name = args.display
+    else:
+        server, display_name = start_xvfb()
+
+    results = []
+    try:
+        print(f"Injecting into {display_name}...", file=sys.stderr)
+        for backend in args.backend:
+            try:
+                results.append(run_backend(display_name, backend, args.events, args.burst))
+            except RuntimeError as ex:
+                print(f"  {backend}: skipped ({ex})", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "display": "xvfb" if server is not None else display_name,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
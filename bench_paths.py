@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+End-to-end key latency of the two ways a note reaches the game:
+
+- uinput: InputHandler -> uinput device -> kernel -> input_bridge.py
+  (separate process, reading evdev) -> X event
+- x: InputHandler -> XDirectSink -> X event (run_music.py --output x)
+
+Each press is timed from InputHandler.write_batch() until the receiving
+window's client reads the event. Runs on a throwaway Xvfb (or --display);
+the uinput path needs write access to /dev/uinput.
+
+    uv run --with python-xlib bench_paths.py --events 1000 -o paths.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench_injection import Receiver, start_xvfb
+from benchmark import git_revision
+from input_handler import InputHandler
+from keycodes import KEYCODES
+from latency import format_percentiles, percentile
+from x_injection import XDirectSink
+
+KEY_CODE = KEYCODES["KEY_A"]
+WINDOW_NAME = "Heartopia"
+PATHS = ("uinput", "x")
+# Seconds the bridge gets to open the device and find the window
+BRIDGE_STARTUP = 10.0
+
+
+def measure(
+    handler: InputHandler, receiver: Receiver, events: int, interval: float
+) -> tuple[list[float], int]:
+    """Presses/releases KEY_CODE events times; returns latencies and lost events."""
+    latency = []
+    lost = 0
+    for n in range(events):
+        start = time.perf_counter()
+        handler.write_batch([(KEY_CODE, 1 - n % 2)])
+        if receiver.wait_key(time.perf_counter() + 1.0):
+            latency.append(time.perf_counter() - start)
+        else:
+            lost += 1
+        # Let the song-like spacing keep both paths out of their burst behavior
+        time.sleep(interval)
+    return latency, lost
+
+
+def run_x(display_name: str, receiver: Receiver, events: int, interval: float):
+    handler = InputHandler({60: KEY_CODE}, sink=XDirectSink(WINDOW_NAME, display_name))
+    try:
+        return measure(handler, receiver, events, interval)
+    finally:
+        handler.cleanup()
+
+
+def run_uinput(display_name: str, receiver: Receiver, events: int, interval: float):
+    # No device_path: InputHandler creates its own uinput device
+    handler = InputHandler({60: KEY_CODE})
+    device_path = handler.ui.device.path  # type: ignore
+    bridge = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "input_bridge.py"),
+            device_path,
+            "--window",
+            WINDOW_NAME,
+            "--display",
+            display_name,
+            "--log-level",
+            "warning",
+        ],
+    )
+    try:
+        # Probe until the bridge delivers, so its startup isn't measured
+        deadline = time.perf_counter() + BRIDGE_STARTUP
+        value = 1
+        while True:
+            handler.write_batch([(KEY_CODE, value)])
+            value = 1 - value
+            if receiver.wait_key(time.perf_counter() + 0.2):
+                break
+            if time.perf_counter() > deadline or bridge.poll() is not None:
+                raise RuntimeError("the input bridge never delivered a key")
+        # Leave the key released before measuring
+        if value == 0:
+            handler.write_batch([(KEY_CODE, 0)])
+            receiver.wait_key(time.perf_counter() + 1.0)
+        while receiver.wait_key(time.perf_counter() + 0.2):
+            pass
+        return measure(handler, receiver, events, interval)
+    finally:
+        handler.cleanup()
+        bridge.terminate()
+        bridge.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare uinput+bridge and direct X latency.")
+    parser.add_argument("--path", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        metavar="MS",
+        help="Pause between events (default: 5)",
+    )
+    parser.add_argument(
+        "--display",
+        default=None,
+        help="Use this display instead of starting Xvfb",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="Write JSON results here (default: stdout)"
+    )
+    args = parser.parse_args()
+
+    server = None
+    if args.display:
+        display_name = args.display
+    else:
+        server, display_name = start_xvfb()
+
+    runners = {"uinput": run_uinput, "x": run_x}
+    results = []
+    try:
+        for path in args.path:
+            receiver = Receiver(display_name)
+            try:
+                latency, lost = runners[path](
+                    display_name, receiver, args.events, args.interval / 1000
+                )
+            except Exception as ex:
+                # No /dev/uinput access, the bridge never delivered...
+                print(f"  {path}: skipped ({ex})", file=sys.stderr)
+                continue
+            finally:
+                receiver.close()
+            latency.sort()
+            print(f"  {path}: {format_percentiles(latency)}", file=sys.stderr)
+            results.append(
+                {
+                    "path": path,
+                    "events": args.events,
+                    "lost": lost,
+                    "latency_ms": {
+                        "p50": percentile(latency, 50) * 1000,
+                        "p95": percentile(latency, 95) * 1000,
+                        "p99": percentile(latency, 99) * 1000,
+                        "max": percentile(latency, 100) * 1000,
+                    },
+                }
+            )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "display": "xvfb" if server is not None else display_name,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
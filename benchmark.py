@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Playback benchmark: plays synthetic MIDI workloads into an in-process sink
+(no uinput or game needed) and reports throughput, timing jitter, CPU time,
+peak thread count and peak RSS as JSON, so revisions can be compared. Each
+workload runs in its own process, so its peak RSS is its own.
+
+    uv run benchmark.py --nps 20 100 400 --chord 1 4 --length 10 -o bench.json
+    uv run benchmark.py --nps 20 100 400 --chord 1 4 --baseline bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import mido
+
+from input_handler import EV_KEY, EV_SYN, RecordingSink
+from latency import percentile
+from player import MidiPlayer
+from timing import TIMING_MODES
+
+# Pitch pools per layout, so every generated note maps to a key
+LAYOUT_NOTES = {
+    "keyboard": list(range(48, 85)),
+    "guitar": [60, 62, 64, 65, 67, 69, 71, 72, 74, 76, 77, 79, 81, 83, 84],
+    "drums": [36, 38, 42, 46, 45, 48, 49, 51],
+}
+
+
+def generate_workload(
+    notes_per_second: float,
+    chord_size: int,
+    length: float,
+    layout: str,
+    seed: int = 0,
+) -> mido.MidiFile:
+    """
+    Builds an in-memory MIDI file with notes_per_second note_on events per
+    second (grouped into chords of chord_size) for length seconds.
+    """
+    rng = random.Random(seed)
+    mid = mido.MidiFile(ticks_per_beat=480)
+    track = mido.MidiTrack()
+    mid.tracks.append(track)
+    # 120 BPM: 960 ticks per second
+    track.append(mido.MetaMessage("set_tempo", tempo=500000, time=0))
+
+    ticks_per_second = 960
+    chords_per_second = notes_per_second / chord_size
+    step = max(1, round(ticks_per_second / chords_per_second))
+    chord_count = int(length * ticks_per_second / step)
+    pool = LAYOUT_NOTES[layout]
+    channel = 9 if layout == "drums" else 0
+
+    for n in range(chord_count):
+        notes = rng.sample(pool, min(chord_size, len(pool)))
+        for k, note in enumerate(notes):
+            track.append(
+                mido.Message(
+                    "note_on",
+                    channel=channel,
+                    note=note,
+                    velocity=100,
+                    time=step if k == 0 and n > 0 else 0,
+                )
+            )
+    return mid
+
+
+class ThreadSampler:
+    """Samples threading.active_count() in the background to find the peak."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Don't count the sampler itself
+            self.peak = max(self.peak, threading.active_count() - 1)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "ThreadSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_workload(
+    notes_per_second: float,
+    chord_size: int,
+    length: float,
+    layout: str,
+    timing: str,
+    spin_threshold: float,
+) -> dict:
+    mid = generate_workload(notes_per_second, chord_size, length, layout)
+    sink = RecordingSink()
+    player = MidiPlayer(
+        midi_file="<benchmark>",
+        layout=layout,
+        timing=timing,
+        spin_threshold=spin_threshold,
+        midi=mid,
+        sink=sink,
+        countdown=0,
+        quiet=True,
+        # Records per-press samples; the printed report is discarded below
+        latency_report=True,
+    )
+
+    compile_start = time.perf_counter()
+    # Keep the benchmark output machine-readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        player.prepare()
+    compile_time = time.perf_counter() - compile_start
+    schedule = player.schedule
+    assert schedule is not None
+
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    wall_start = time.perf_counter()
+    with ThreadSampler() as sampler, contextlib.redirect_stdout(io.StringIO()):
+        player.start()
+    wall = time.perf_counter() - wall_start
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (
+        usage_end.ru_stime - usage_start.ru_stime
+    )
+    lateness = sorted(player.timer.stats.lateness)
+    presses = sorted(player.latency.lateness()) if player.latency else []
+    # cleanup() always ends with a release_all frame, which is not playback
+    syn = [i for i, (_, etype, _, _) in enumerate(sink.events) if etype == EV_SYN]
+    played = sink.events[: syn[-2] + 1] if len(syn) > 1 else []
+    key_events = sum(1 for _, etype, _, _ in played if etype == EV_KEY)
+    frames = len(played) - key_events
+
+    return {
+        "workload": {
+            "notes_per_second": notes_per_second,
+            "chord_size": chord_size,
+            "length": length,
+            "layout": layout,
+            "timing": timing,
+        },
+        "schedule_events": len(schedule),
+        "compile_ms": compile_time * 1000,
+        "wall_s": wall,
+        "key_events": key_events,
+        "frames": frames,
+        "events_per_s": key_events / wall if wall > 0 else 0.0,
+        "jitter_ms": {
+            "p50": percentile(lateness, 50) * 1000,
+            "p95": percentile(lateness, 95) * 1000,
+            "p99": percentile(lateness, 99) * 1000,
+            "max": percentile(lateness, 100) * 1000,
+        },
+        "press_lateness_p99_ms": percentile(presses, 99) * 1000,
+        "cpu_s": cpu,
+        "cpu_pct": cpu / wall * 100 if wall > 0 else 0.0,
+        "peak_threads": sampler.peak,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": usage_end.ru_maxrss / 1024,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def workload_key(result: dict) -> tuple:
+    w = result["workload"]
+    return (
+        w["notes_per_second"],
+        w["chord_size"],
+        w["length"],
+        w["layout"],
+        w["timing"],
+    )
+
+
+def compare(results: list[dict], baseline_path: str) -> None:
+    """Prints the change of the headline metrics against a previous run."""
+    with open(baseline_path) as f:
+        baseline = {workload_key(r): r for r in json.load(f)["results"]}
+
+    metrics = (
+        ("jitter p99 ms", lambda r: r["jitter_ms"]["p99"]),
+        ("cpu %", lambda r: r["cpu_pct"]),
+        ("peak threads", lambda r: r["peak_threads"]),
+        ("peak RSS MB", lambda r: r["peak_rss_mb"]),
+    )
+    for result in results:
+        old = baseline.get(workload_key(result))
+        if old is None:
+            continue
+        changes = ", ".join(
+            f"{name} {get(old):.2f} -> {get(result):.2f}" for name, get in metrics
+        )
+        print(f"{workload_key(result)}: {changes}", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark MidiPlayer playback.")
+    parser.add_argument(
+        "--nps",
+        type=float,
+        nargs="+",
+        default=[20.0, 100.0],
+        help="Notes per second (one run per value)",
+    )
+    parser.add_argument(
+        "--chord", type=int, nargs="+", default=[1, 4], help="Notes per chord"
+    )
+    parser.add_argument(
+        "--length", type=float, nargs="+", default=[5.0], help="Song length (s)"
+    )
+    parser.add_argument(
+        "--layout",
+        nargs="+",
+        choices=list(LAYOUT_NOTES),
+        default=["keyboard"],
+    )
+    parser.add_argument("--timing", nargs="+", choices=TIMING_MODES, default=["sleep"])
+    parser.add_argument(
+        "--spin-threshold",
+        type=float,
+        default=2.0,
+        help="Hybrid timing spin threshold in ms",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="Write JSON results here (default: stdout)"
+    )
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="Previous JSON results to compare against (printed to stderr)",
+    )
+    args = parser.parse_args()
+
+    results = []
+    # A fresh process per workload: ru_maxrss is a high-water mark for the
+    # whole process, so sharing one would carry the largest workload's peak
+    # RSS over to every later one
+    pool = ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=1,
+    )
+    with pool:
+        for nps, chord, length, layout, timing in itertools.product(
+            args.nps, args.chord, args.length, args.layout, args.timing
+        ):
+            print(
+                f"Running {layout} {nps:g} notes/s, chords of {chord}, "
+                f"{length:g}s, {timing}...",
+                file=sys.stderr,
+            )
+            future = pool.submit(
+                run_workload,
+                nps,
+                chord,
+                length,
+                layout,
+                timing,
+                args.spin_threshold / 1000,
+            )
+            results.append(future.result())
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Long-running player: keeps one input device open and plays a queue of songs
+back to back, controlled over a Unix domain socket.
+
+    uv run daemon.py serve --id 1 --layout keyboard
+    uv run daemon.py enqueue musicas/a.mid musicas/b.mid --id 1
+    uv run daemon.py status --id 1
+    uv run daemon.py pause|resume|skip|stop|shutdown --id 1
+    uv run daemon.py seek --bar 17 --id 1
+    uv run daemon.py speed --speed 0.8 --id 1
+
+The next queued song is compiled in the background while the current one
+plays, so songs change without a gap or a countdown.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from collections import deque
+
+from engine import Timeline, Transport, make_note_log
+from event_log import RingLog
+from input_handler import InputHandler, Sink
+from mappings import layout_mapping
+from player import MidiPlayer
+from run_music import resolve_device_path
+from tape_cache import DEFAULT_CACHE_DIR, TapeCache
+from timing import TIMING_MODES, make_timer
+
+COMMANDS = (
+    "enqueue",
+    "skip",
+    "pause",
+    "resume",
+    "seek",
+    "speed",
+    "stop",
+    "status",
+    "shutdown",
+)
+
+
+def default_socket_path(instance_id: int | None = None) -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", "/tmp")
+    suffix = f"-{instance_id}" if instance_id is not None else ""
+    return os.path.join(runtime_dir, f"hertopia-musica{suffix}.sock")
+
+
+class Song:
+    """One queue entry. state is queued, preparing, ready or failed."""
+
+    def __init__(self, midi_file: str, speed: float, transpose: int):
+        self.midi_file = midi_file
+        self.speed = speed
+        self.transpose = transpose
+        self.state = "queued"
+        self.player: MidiPlayer | None = None
+
+    def describe(self) -> dict:
+        return {
+            "file": self.midi_file,
+            "speed": self.speed,
+            "transpose": self.transpose,
+            "state": self.state,
+        }
+
+
+class PlayerDaemon:
+    """
+    Song queue plus the threads that serve it.
+
+    The playback thread plays the queue head once it is ready; the preparer
+    thread compiles the queue head while the song before it plays; the
+    socket server turns commands into state changes under self._cond.
+    """
+
+    def __init__(
+        self,
+        layout: str = "keyboard",
+        device_path: str | None = None,
+        dry_run: bool = False,
+        timing: str = "sleep",
+        spin_threshold: float = 0.002,
+        tape_cache: TapeCache | None = None,
+        min_retrigger: float = 0.0,
+        quiet: bool = False,
+        log_file: str | None = None,
+        sink: Sink | None = None,
+    ):
+        self.layout = layout
+        self.dry_run = dry_run
+        self.tape_cache = tape_cache
+        self.min_retrigger = min_retrigger
+        # Opened once and shared by every song's player
+        self.input_handler = InputHandler(
+            layout_mapping(layout),
+            dry_run=dry_run,
+            device_path=device_path,
+            sink=sink,
+        )
+        self.timer = make_timer(timing, spin_threshold)
+        self.quiet = quiet
+        self.log_file = log_file
+        # Built by serve(), shared by every song's transport
+        self.log: RingLog | None = None
+
+        self.queue: deque[Song] = deque()
+        self.current: Song | None = None
+        self.transport: Transport | None = None
+        self._cond = threading.Condition()
+        self._running = True
+
+    @property
+    def state(self) -> str:
+        if self.transport is None:
+            return "idle"
+        return "paused" if self.transport.paused else "playing"
+
+    # --- Commands (called from socket handler threads) ---
+
+    def enqueue(self, midi_file: str, speed: float = 1.0, transpose: int = 0) -> dict:
+        if speed <= 0:
+            return {"ok": False, "error": "Speed must be positive."}
+        with self._cond:
+            song = Song(os.path.abspath(midi_file), speed, transpose)
+            self.queue.append(song)
+            self._cond.notify_all()
+            return {"ok": True, "queued": len(self.queue)}
+
+    def skip(self) -> dict:
+        with self._cond:
+            if self.transport is None:
+                return {"ok": False, "error": "Nothing is playing."}
+            self.transport.stop()
+            return {"ok": True}
+
+    def pause(self) -> dict:
+        with self._cond:
+            if self.transport is None or not self.transport.pause():
+                return {"ok": False, "error": "Not playing."}
+            return {"ok": True}
+
+    def resume(self) -> dict:
+        with self._cond:
+            if self.transport is None or not self.transport.resume():
+                return {"ok": False, "error": "Not paused."}
+            return {"ok": True}
+
+    def seek(self, seconds: float | None = None, bar: int | None = None) -> dict:
+        with self._cond:
+            if self.transport is None:
+                return {"ok": False, "error": "Nothing is playing."}
+            if bar is not None:
+                self.transport.seek_bar(bar)
+            else:
+                self.transport.seek(seconds or 0.0)
+            return {"ok": True}
+
+    def speed(self, speed: float) -> dict:
+        with self._cond:
+            if self.transport is None or self.current is None:
+                return {"ok": False, "error": "Nothing is playing."}
+            if speed <= 0:
+                return {"ok": False, "error": "Speed must be positive."}
+            # The schedule was compiled at the song's own speed
+            self.transport.set_rate(speed / self.current.speed)
+            return {"ok": True}
+
+    def stop(self) -> dict:
+        """Stops the current song and clears the queue; the daemon keeps running."""
+        with self._cond:
+            self.queue.clear()
+            if self.transport is not None:
+                self.transport.stop()
+            return {"ok": True}
+
+    def status(self) -> dict:
+        with self._cond:
+            current = None
+            if self.current is not None and self.transport is not None:
+                current = self.current.describe()
+                current["position"] = round(self.transport.position, 3)
+                current["duration"] = round(self.transport.duration, 3)
+                current["rate"] = self.transport.rate
+            return {
+                "ok": True,
+                "state": self.state,
+                "current": current,
+                "queue": [song.describe() for song in self.queue],
+            }
+
+    def shutdown(self) -> dict:
+        with self._cond:
+            self._running = False
+            if self.transport is not None:
+                self.transport.stop()
+            self._cond.notify_all()
+            return {"ok": True}
+
+    def handle(self, request: dict) -> dict:
+        command = request.get("command")
+        try:
+            if command == "enqueue":
+                return self.enqueue(
+                    request["file"],
+                    float(request.get("speed", 1.0)),
+                    int(request.get("transpose", 0)),
+                )
+            if command == "seek":
+                bar = request.get("bar")
+                return self.seek(
+                    float(request.get("seconds", 0.0)),
+                    int(bar) if bar is not None else None,
+                )
+            if command == "speed":
+                return self.speed(float(request["speed"]))
+        except (KeyError, TypeError, ValueError):
+            return {"ok": False, "error": f"Invalid arguments for '{command}'."}
+        if command in COMMANDS:
+            return getattr(self, command)()
+        return {"ok": False, "error": f"Unknown command '{command}'."}
+
+    # --- Worker threads ---
+
+    def _prepare_loop(self) -> None:
+        """Compiles the queue head while the current song plays."""
+        while True:
+            with self._cond:
+                while self._running and not (
+                    self.queue and self.queue[0].state == "queued"
+                ):
+                    self._cond.wait()
+                if not self._running:
+                    return
+                song = self.queue[0]
+                song.state = "preparing"
+
+            print(f"Preparing '{song.midi_file}'...")
+            player = MidiPlayer(
+                midi_file=song.midi_file,
+                speed=song.speed,
+                transpose=song.transpose,
+                dry_run=self.dry_run,
+                layout=self.layout,
+                tape_cache=self.tape_cache,
+                min_retrigger=self.min_retrigger,
+                input_handler=self.input_handler,
+            )
+            try:
+                ok = player.prepare() and player.schedule is not None
+            except Exception as ex:
+                print(f"Error preparing '{song.midi_file}': {ex}")
+                ok = False
+
+            with self._cond:
+                song.player = player if ok else None
+                song.state = "ready" if ok else "failed"
+                self._cond.notify_all()
+
+    def _playback_loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not (
+                    self.queue and self.queue[0].state in ("ready", "failed")
+                ):
+                    self._cond.wait()
+                if not self._running:
+                    return
+                song = self.queue.popleft()
+                # Lets the preparer start on the song after this one
+                self._cond.notify_all()
+                if song.player is None or song.player.schedule is None:
+                    print(f"Skipping '{song.midi_file}' (failed to prepare).")
+                    continue
+                self.current = song
+                self.transport = Transport(
+                    Timeline([song.player.schedule]),
+                    [self.input_handler],
+                    self.timer,
+                    self.log,
+                )
+                transport = self.transport
+
+            print(f"Playing '{song.midi_file}'...")
+            transport.play()
+            with self._cond:
+                self.current = None
+                self.transport = None
+
+    def serve(self, socket_path: str) -> None:
+        if os.path.exists(socket_path):
+            # A leftover socket from a crashed daemon, unless one still answers
+            try:
+                send_command(socket_path, {"command": "status"})
+                print(f"Error: A daemon is already listening on {socket_path}.")
+                return
+            except OSError:
+                os.unlink(socket_path)
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                line = self.rfile.readline()
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if isinstance(request, dict):
+                    response = daemon.handle(request)
+                else:
+                    response = {"ok": False, "error": "Invalid request."}
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._prepare_loop, daemon=True).start()
+        print(f"Listening on {socket_path}. Press Ctrl+C to quit.")
+
+        self.log = make_note_log(quiet=self.quiet, log_file=self.log_file).start()
+        try:
+            self._playback_loop()
+        except KeyboardInterrupt:
+            print("\nStopping...")
+        finally:
+            self.shutdown()
+            server.shutdown()
+            server.server_close()
+            os.unlink(socket_path)
+            self.log.close()
+            print(self.timer.stats.summary())
+            print("Releasing all keys...")
+            self.input_handler.cleanup()
+            print("Done.")
+
+
+def send_command(socket_path: str, request: dict) -> dict:
+    """Sends one JSON request to a running daemon and returns its reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        reply = sock.makefile("rb").readline()
+    return json.loads(reply)
+
+
+def print_status(status: dict) -> None:
+    current = status["current"]
+    if current is None:
+        print(f"State: {status['state']}")
+    else:
+        print(
+            f"State: {status['state']} '{current['file']}' "
+            f"{current['position']:.1f}s / {current['duration']:.1f}s"
+        )
+    for n, song in enumerate(status["queue"], 1):
+        print(f"  {n}. {song['file']} ({song['state']})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Player daemon with a song queue.")
+    parser.add_argument("command", choices=("serve",) + COMMANDS)
+    parser.add_argument("files", nargs="*", help="MIDI files to enqueue")
+    parser.add_argument(
+        "--id",
+        type=int,
+        default=None,
+        help="Target instance ID (picks its device and socket)",
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="Control socket path (default: $XDG_RUNTIME_DIR/hertopia-musica[-ID].sock)",
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="enqueue/speed: playback speed"
+    )
+    parser.add_argument("--transpose", type=int, default=0, help="enqueue: semitones")
+    parser.add_argument(
+        "--to", type=float, default=0.0, metavar="SECONDS", help="seek: position"
+    )
+    parser.add_argument("--bar", type=int, default=None, help="seek: bar number")
+
+    serve = parser.add_argument_group("serve options")
+    serve.add_argument("--device-path", default=None)
+    serve.add_argument(
+        "--layout", choices=["keyboard", "guitar", "drums"], default="keyboard"
+    )
+    serve.add_argument("--dry-run", action="store_true")
+    serve.add_argument("--timing", choices=TIMING_MODES, default="sleep")
+    serve.add_argument("--spin-threshold", type=float, default=2.0, metavar="MS")
+    serve.add_argument("--min-retrigger", type=float, default=0.0, metavar="MS")
+    serve.add_argument("--quiet", action="store_true")
+    serve.add_argument("--log-file", default=None)
+    serve.add_argument("--no-cache", action="store_true")
+    serve.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    # Intermixed so files may come before or after the options
+    args = parser.parse_intermixed_args()
+
+    socket_path = args.socket or default_socket_path(args.id)
+
+    if args.command == "serve":
+        device_path = args.device_path or resolve_device_path(args.id)
+        daemon = PlayerDaemon(
+            layout=args.layout,
+            device_path=device_path,
+            dry_run=args.dry_run,
+            timing=args.timing,
+            spin_threshold=args.spin_threshold / 1000,
+            tape_cache=None if args.no_cache else TapeCache(args.cache_dir),
+            min_retrigger=args.min_retrigger / 1000,
+            quiet=args.quiet,
+            log_file=args.log_file,
+        )
+        for midi_file in args.files:
+            daemon.enqueue(midi_file)
+        daemon.serve(socket_path)
+        return
+
+    if args.command == "enqueue":
+        if not args.files:
+            parser.error("enqueue needs at least one MIDI file")
+        requests = [
+            {
+                "command": "enqueue",
+                "file": os.path.abspath(f),
+                "speed": args.speed,
+                "transpose": args.transpose,
+            }
+            for f in args.files
+        ]
+    elif args.command == "seek":
+        requests = [{"command": "seek", "seconds": args.to, "bar": args.bar}]
+    elif args.command == "speed":
+        requests = [{"command": "speed", "speed": args.speed}]
+    else:
+        requests = [{"command": args.command}]
+
+    reply: dict = {}
+    try:
+        for request in requests:
+            reply = send_command(socket_path, request)
+            if not reply.get("ok"):
+                print(f"Error: {reply.get('error')}")
+                sys.exit(1)
+    except OSError as ex:
+        print(f"Error: Could not reach the daemon at {socket_path}: {ex}")
+        sys.exit(1)
+
+    if args.command == "status":
+        print_status(reply)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import bisect
+from collections.abc import Sequence
+
+
+def assign_keys(
+    times: Sequence[float], options: Sequence[tuple[int, ...]]
+) -> list[int]:
+    """
+    Picks one key per hit, for notes that may be played on several keys.
+
+    times are the hits' deadlines in ascending order and options[i] the keys
+    hit i may use (drums map e.g. the kick to Y or H). Hits with a single
+    option are forced. Every other hit gets the option with the most slack:
+    the smaller of the time since that key was last pressed and the time until
+    its next forced use. That spreads rolls over the alternate keys and keeps
+    them off keys another drum is about to need (toms share Y/U/I with the
+    kick, snare and hi-hat).
+    """
+    # Upcoming forced presses of each key, for the lookahead
+    forced: dict[int, list[float]] = {}
+    for t, keys in zip(times, options):
+        if len(keys) == 1:
+            forced.setdefault(keys[0], []).append(t)
+
+    last_press: dict[int, float] = {}
+    chosen: list[int] = []
+    for t, keys in zip(times, options):
+        key_code = keys[0]
+        if len(keys) > 1:
+            best = None
+            for candidate in keys:
+                since = t - last_press.get(candidate, float("-inf"))
+                uses = forced.get(candidate, ())
+                n = bisect.bisect_left(uses, t)
+                until = uses[n] - t if n < len(uses) else float("inf")
+                # Ties go to the longest recovery, then to the first key listed
+                score = (min(since, until), since)
+                if best is None or score > best:
+                    best = score
+                    key_code = candidate
+        last_press[key_code] = t
+        chosen.append(key_code)
+    return chosen
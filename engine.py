@@ -0,0 +1,462 @@
+import bisect
+import heapq
+import sys
+import threading
+import time
+from array import array
+from typing import TYPE_CHECKING, Callable, Iterator, Sequence
+
+import startup
+from event_log import RingLog
+from latency import LatencyRecorder
+from mappings import get_key_name
+from schedule import ACTION_PRESS, Schedule
+from timing import Timer, make_timer
+
+if TYPE_CHECKING:
+    from input_handler import InputHandler
+    from player import MidiPlayer
+
+
+# RingLog record kinds
+LOG_NOTE = 1
+
+
+def make_note_log(
+    labels: Sequence[str] | None = None,
+    quiet: bool = False,
+    log_file: str | None = None,
+) -> RingLog:
+    """
+    Builds the per-note log for playback.
+
+    Notes go to stdout by default, to log_file if given, or nowhere with
+    quiet. Either way the playback loop only stores records; formatting and
+    writing happen on the log's writer thread.
+    """
+
+    def format_record(kind: int, note: int, key_code: int, part: int) -> str:
+        prefix = f"[{labels[part]}] " if labels else ""
+        return f"{prefix}Note {note} -> Key '{get_key_name(key_code)}'"
+
+    sink = None
+    if log_file:
+        sink = open(log_file, "a")
+    elif not quiet:
+        sink = sys.stdout
+    return RingLog(format_record, sink, timestamps=log_file is not None)
+
+
+def report_latency(
+    latency: LatencyRecorder | None, report: bool, dump_path: str | None
+) -> None:
+    if latency is None:
+        return
+    if report:
+        latency.report()
+    if dump_path:
+        latency.dump(dump_path)
+
+
+class Timeline:
+    """
+    Several schedules merged into one deadline-ordered index.
+
+    Entry j points at schedules[parts[j]] entry indices[j]; times[j] is its
+    deadline, copied here so the hot loop touches a single array.
+    """
+
+    def __init__(self, schedules: Sequence[Schedule]):
+        self.schedules = list(schedules)
+        self.times: array[float] = array("d")
+        self.parts: array[int] = array("H")
+        self.indices: array[int] = array("I")
+
+        streams = [_entries(p, s) for p, s in enumerate(self.schedules)]
+        for t, p, i in heapq.merge(*streams):
+            self.times.append(t)
+            self.parts.append(p)
+            self.indices.append(i)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def duration(self) -> float:
+        return self.times[-1] if self.times else 0.0
+
+    def index_at(self, seconds: float) -> int:
+        """First entry at or after song position seconds."""
+        return bisect.bisect_left(self.times, seconds)
+
+    def time_at_beat(self, beat: float) -> float:
+        """Song position of beat, by the first part's beat grid."""
+        if not self.schedules:
+            return 0.0
+        return self.schedules[0].time_at_beat(beat)
+
+    def time_at_bar(self, bar: int) -> float:
+        """Song position of the start of (1-based) bar."""
+        if not self.schedules:
+            return 0.0
+        return self.time_at_beat((bar - 1) * self.schedules[0].beats_per_bar)
+
+
+def _entries(part: int, schedule: Schedule) -> Iterator[tuple[float, int, int]]:
+    times = schedule.times
+    for i in range(len(times)):
+        yield times[i], part, i
+
+
+def play_timeline(
+    timeline: Timeline,
+    handlers: Sequence["InputHandler"],
+    timer: Timer,
+    t0: float,
+    is_running: Callable[[], bool],
+    log: RingLog | None = None,
+    latency: LatencyRecorder | None = None,
+    start: int = 0,
+    wake: threading.Event | None = None,
+    rate: float = 1.0,
+) -> int:
+    """
+    Writes every timeline entry to its part's InputHandler at t0 + deadline.
+
+    Entries sharing a deadline are grouped per part and written as one evdev
+    frame each. A key that appears twice for the same part (release then
+    re-press) starts a new frame so the game sees both transitions.
+
+    Playback begins at timeline entry start, and entry j is due at
+    t0 + times[j] / rate. Returns the index of the first entry not written:
+    len(timeline) when the song finished, less when is_running() turned
+    false (so playback can be resumed from there). Setting wake cuts the
+    wait for the next deadline short so is_running() is checked at once.
+    """
+    times = timeline.times
+    parts = timeline.parts
+    indices = timeline.indices
+    schedules = timeline.schedules
+    count = len(timeline)
+    batches: list[list[tuple[int, int]]] = [[] for _ in handlers]
+    # Schedule indices of the entries in each batch, for latency recording
+    pending: list[list[int]] = [[] for _ in handlers]
+
+    def flush(p: int) -> None:
+        written = handlers[p].write_batch(batches[p])
+        if latency is not None:
+            latency.record(p, pending[p], t0, written, rate)
+        batches[p].clear()
+        pending[p].clear()
+
+    i = start
+    while i < count and is_running():
+        deadline = times[i]
+        timer.wait_until(t0 + deadline / rate, wake)
+        if not is_running():
+            break
+
+        while i < count and times[i] == deadline:
+            p = parts[i]
+            schedule = schedules[p]
+            j = indices[i]
+            key_code = schedule.codes[j]
+            value = schedule.actions[j]
+            if any(code == key_code for code, _ in batches[p]):
+                flush(p)
+            batches[p].append((key_code, value))
+            pending[p].append(j)
+            if value == ACTION_PRESS and log is not None:
+                log.record(LOG_NOTE, schedule.notes[j], key_code, p)
+            i += 1
+
+        for p, batch in enumerate(batches):
+            if batch:
+                flush(p)
+
+    return i
+
+
+class Transport:
+    """
+    Plays a Timeline with pause/resume, seek and live speed changes.
+
+    play() runs on the playback thread; the control methods may be called
+    from any other thread. Each one wakes play_timeline, which returns the
+    next unwritten entry, and play() starts it again from there with t0
+    re-anchored to the song position. Deadlines stay absolute offsets from
+    t0, so any number of pauses or speed changes never adds up to drift.
+    """
+
+    def __init__(
+        self,
+        timeline: Timeline,
+        handlers: Sequence["InputHandler"],
+        timer: Timer,
+        log: RingLog | None = None,
+        latency: LatencyRecorder | None = None,
+        rate: float = 1.0,
+    ):
+        self.timeline = timeline
+        self.handlers = list(handlers)
+        self.timer = timer
+        self.log = log
+        self.latency = latency
+        # Playback speed relative to the compiled schedule
+        self.rate = rate
+        self.paused = False
+        self.stopped = False
+        # Next entry to write, and the song position (s) to continue from
+        self.index = 0
+        self.song_time = 0.0
+        self._seek_index: int | None = None
+        self._release_held = False
+        # Set only while play_timeline runs
+        self._t0: float | None = None
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+
+    @property
+    def position(self) -> float:
+        """Current song position, in compiled-schedule seconds."""
+        with self._cond:
+            return self._position()
+
+    @property
+    def duration(self) -> float:
+        return self.timeline.duration
+
+    def _position(self) -> float:
+        if self._t0 is None:
+            return self.song_time
+        return max(0.0, (time.perf_counter() - self._t0) * self.rate)
+
+    def _interrupt(self, release_held: bool) -> None:
+        self.song_time = self._position()
+        self._t0 = None
+        self._release_held = self._release_held or release_held
+        self._wake.set()
+        self._cond.notify_all()
+
+    def pause(self) -> bool:
+        """Stops at the current position and releases held keys."""
+        with self._cond:
+            if self.paused or self.stopped:
+                return False
+            self._interrupt(release_held=True)
+            self.paused = True
+            return True
+
+    def resume(self) -> bool:
+        with self._cond:
+            if not self.paused or self.stopped:
+                return False
+            self.paused = False
+            self._cond.notify_all()
+            return True
+
+    def seek(self, seconds: float) -> None:
+        """Moves to song position seconds (clamped to the song)."""
+        with self._cond:
+            self._interrupt(release_held=True)
+            self.song_time = min(max(0.0, seconds), self.duration)
+            self._seek_index = self.timeline.index_at(self.song_time)
+
+    def seek_beat(self, beat: float) -> None:
+        self.seek(self.timeline.time_at_beat(beat))
+
+    def seek_bar(self, bar: int) -> None:
+        self.seek(self.timeline.time_at_bar(bar))
+
+    def set_rate(self, rate: float) -> None:
+        """Changes the speed from the current position on; held keys stay down."""
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        with self._cond:
+            self._interrupt(release_held=False)
+            self.rate = rate
+
+    def stop(self) -> None:
+        with self._cond:
+            self.stopped = True
+            self._interrupt(release_held=True)
+
+    def play(self, start: float | None = None) -> bool:
+        """
+        Plays until the end of the timeline or stop(), honouring pauses.
+
+        start is the time.perf_counter() instant the current position plays
+        at (default: now). Returns True if the song played to the end.
+        """
+        count = len(self.timeline)
+        while True:
+            with self._cond:
+                while self.paused and not self.stopped:
+                    self._cond.wait()
+                if self.stopped:
+                    return False
+                if self._seek_index is not None:
+                    self.index = self._seek_index
+                    self._seek_index = None
+                if self.index >= count:
+                    return True
+                self._wake.clear()
+                anchor = start if start is not None else time.perf_counter()
+                start = None
+                self._t0 = t0 = anchor - self.song_time / self.rate
+                index, rate = self.index, self.rate
+
+            reached = play_timeline(
+                self.timeline,
+                self.handlers,
+                self.timer,
+                t0,
+                lambda: not self._wake.is_set(),
+                self.log,
+                self.latency,
+                start=index,
+                wake=self._wake,
+                rate=rate,
+            )
+
+            with self._cond:
+                self.index = reached
+                if not self._wake.is_set():
+                    # Finished: the loop returns on the next pass
+                    self._t0 = None
+                    self.song_time = self.duration
+                release, self._release_held = self._release_held, False
+            if release:
+                for handler in self.handlers:
+                    handler.release_all()
+
+
+class PlaybackEngine:
+    """
+    Plays several MidiPlayer parts, each on its own device, from one scheduler.
+
+    All parts are compiled first (the start barrier); only when every part is
+    ready is a single shared t0 taken, so a band of instances starts on the
+    same beat and stays on one monotonic timebase for the whole song.
+    """
+
+    def __init__(
+        self,
+        players: Sequence["MidiPlayer"],
+        labels: Sequence[str] | None = None,
+        timing: str = "sleep",
+        spin_threshold: float = 0.002,
+        quiet: bool = False,
+        log_file: str | None = None,
+        latency_report: bool = False,
+        latency_dump: str | None = None,
+    ):
+        self.players = list(players)
+        self.labels = (
+            list(labels) if labels else [str(i + 1) for i in range(len(players))]
+        )
+        self.timer = make_timer(timing, spin_threshold)
+        self.quiet = quiet
+        self.log_file = log_file
+        # Built by start() once every part is compiled
+        self.log: RingLog | None = None
+        self.latency_report = latency_report
+        self.latency_dump = latency_dump
+        self.latency: LatencyRecorder | None = None
+        self.running = False
+        # Set while playing; pause/resume/seek/set_rate act on it
+        self.transport: Transport | None = None
+
+    def prepare(self) -> Timeline | None:
+        for label, player in zip(self.labels, self.players):
+            print(f"[{label}] Compiling '{player.midi_file}' ({player.layout})...")
+            if not player.prepare() or player.schedule is None:
+                print(f"[{label}] Failed to prepare part. Aborting.")
+                return None
+            if player.dry_run:
+                player.schedule.dump()
+        return Timeline([p.schedule for p in self.players if p.schedule is not None])
+
+    def start(
+        self,
+        start_at: float | None = None,
+        countdown: int = 3,
+        position: float = 0.0,
+        bar: int | None = None,
+    ) -> None:
+        """
+        Plays all parts together.
+
+        start_at is an optional wall-clock (time.time()) instant to start on,
+        for lining up with other engines; otherwise playback starts after the
+        countdown. If start_at has already passed, playback joins the song
+        where it would be by now. position (seconds) or bar (by the first
+        part's bars) skips ahead in the song.
+        """
+        timeline = self.prepare()
+        if timeline is None:
+            self.stop()
+            return
+
+        startup.mark("parts compiled")
+        print(f"All {len(self.players)} parts ready. Press Ctrl+C to stop.")
+        # Song seconds already over when we start (a start_at in the past)
+        late = 0.0
+        if start_at is None:
+            countdown_start = time.perf_counter()
+            for i in range(countdown, 0, -1):
+                print(f"{i}...")
+                time.sleep(1)
+            startup.exclude(time.perf_counter() - countdown_start)
+            t0 = time.perf_counter()
+        else:
+            # Translate the wall-clock start into the monotonic timebase once
+            wait = start_at - time.time()
+            if wait >= 0:
+                t0 = time.perf_counter() + wait
+                print(f"Starting in {wait:.1f}s...")
+            else:
+                # Join where the others are instead of firing every overdue
+                # entry at once
+                late = -wait
+                t0 = time.perf_counter()
+                print(f"Start time passed {late:.1f}s ago, joining the song there.")
+
+        if self.latency_report or self.latency_dump:
+            self.latency = LatencyRecorder(timeline.schedules, self.labels)
+
+        self.log = make_note_log(self.labels, self.quiet, self.log_file)
+        self.transport = Transport(
+            timeline,
+            [p.input_handler for p in self.players],
+            self.timer,
+            self.log,
+            self.latency,
+        )
+        if bar is not None:
+            self.transport.seek(timeline.time_at_bar(bar) + late)
+        elif position > 0 or late > 0:
+            self.transport.seek(position + late)
+
+        self.running = True
+        self.log.start()
+        startup.mark("first event scheduled")
+        try:
+            self.transport.play(start=t0)
+        except KeyboardInterrupt:
+            print("\nStopping...")
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        self.running = False
+        if self.transport is not None:
+            self.transport.stop()
+        if self.log is not None:
+            self.log.close()
+        print(self.timer.stats.summary())
+        report_latency(self.latency, self.latency_report, self.latency_dump)
+        print("Releasing all keys...")
+        for player in self.players:
+            player.input_handler.cleanup()
+        print("Done.")
@@ -0,0 +1,112 @@
+import sys
+import threading
+import time
+from array import array
+from typing import Callable, TextIO
+
+# format_record(kind, a, b, c) -> line (without newline)
+RecordFormatter = Callable[[int, int, int, int], str]
+
+
+class RingLog:
+    """
+    Fixed-size event records in a preallocated ring buffer.
+
+    The timing-critical thread calls record(), which only stores a timestamp
+    and four integers into preallocated arrays: no string formatting and no
+    I/O. A background writer (or an explicit dump at exit) formats records
+    and writes them to the sink. If the writer falls more than capacity
+    records behind, the oldest ones are overwritten and counted as dropped.
+
+    record() must only be called from one thread.
+    """
+
+    def __init__(
+        self,
+        formatter: RecordFormatter,
+        sink: TextIO | None = None,
+        capacity: int = 8192,
+        flush_interval: float = 0.25,
+        timestamps: bool = False,
+    ):
+        self.formatter = formatter
+        self.sink = sink
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.timestamps = timestamps
+        self.epoch = time.perf_counter()
+
+        self.times: array[float] = array("d", bytes(8 * capacity))
+        self.kinds: array[int] = array("i", bytes(4 * capacity))
+        self.a: array[int] = array("i", bytes(4 * capacity))
+        self.b: array[int] = array("i", bytes(4 * capacity))
+        self.c: array[int] = array("i", bytes(4 * capacity))
+
+        self.head = 0  # Total records written (next slot is head % capacity)
+        self.tail = 0  # Total records drained
+        self.dropped = 0
+
+        self._stop = threading.Event()
+        self._writer: threading.Thread | None = None
+
+    def record(self, kind: int, a: int = 0, b: int = 0, c: int = 0) -> None:
+        slot = self.head % self.capacity
+        self.times[slot] = time.perf_counter()
+        self.kinds[slot] = kind
+        self.a[slot] = a
+        self.b[slot] = b
+        self.c[slot] = c
+        # Publish only after the slot is fully written
+        self.head += 1
+
+    def start(self) -> "RingLog":
+        """Starts the background writer (no-op without a sink)."""
+        if self.sink is not None and self._writer is None:
+            self._writer = threading.Thread(target=self._run, daemon=True)
+            self._writer.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.drain()
+
+    def drain(self) -> None:
+        """Formats and writes every record not yet written to the sink."""
+        if self.sink is None:
+            return
+        head = self.head
+        if head - self.tail > self.capacity:
+            self.dropped += head - self.tail - self.capacity
+            self.tail = head - self.capacity
+        if self.tail == head:
+            return
+
+        lines: list[str] = []
+        for n in range(self.tail, head):
+            slot = n % self.capacity
+            line = self.formatter(
+                self.kinds[slot], self.a[slot], self.b[slot], self.c[slot]
+            )
+            if self.timestamps:
+                line = f"{self.times[slot] - self.epoch:10.4f} {line}"
+            lines.append(line)
+        self.tail = head
+
+        try:
+            self.sink.write("\n".join(lines) + "\n")
+            self.sink.flush()
+        except (OSError, ValueError):
+            # Closed pipe or file: logging must never take playback down
+            pass
+
+    def close(self) -> None:
+        """Stops the writer and writes whatever is still buffered."""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join(timeout=1)
+            self._writer = None
+        self.drain()
+        if self.dropped:
+            print(f"Log: {self.dropped} records dropped (writer fell behind).")
+        if self.sink is not None and self.sink not in (sys.stdout, sys.stderr):
+            self.sink.close()
@@ -0,0 +1,33 @@
+"""
+Regenerates keycodes.py, the static KEY_* name <-> code tables, from
+evdev.ecodes. The codes are the Linux input ABI, so this only needs to run
+again when a mapping starts using a key the table doesn't have.
+
+    uv run generate_keycodes.py
+"""
+
+from evdev import ecodes as e
+
+OUTPUT_FILE = "keycodes.py"
+
+codes = {
+    n: v for n, v in e.ecodes.items() if isinstance(v, int) and n.startswith("KEY_")
+}
+# Same rule mappings.py used when it built this at import time: the last
+# name listed for a code wins
+names = {v: n for n, v in codes.items()}
+
+with open(OUTPUT_FILE, "w") as f:
+    f.write(
+        '"""Linux KEY_* event codes. Generated by generate_keycodes.py, do not edit."""\n\n'
+    )
+    f.write("KEYCODES: dict[str, int] = {\n")
+    for name, code in sorted(codes.items(), key=lambda item: (item[1], item[0])):
+        f.write(f'    "{name}": {code},\n')
+    f.write("}\n\n")
+    f.write("KEY_NAMES: dict[int, str] = {\n")
+    for code, name in sorted(names.items()):
+        f.write(f'    {code}: "{name}",\n')
+    f.write("}\n")
+
+print(f"Wrote {len(codes)} key codes to {OUTPUT_FILE}")
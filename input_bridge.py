@@ -1,238 +1,821 @@
 #!/usr/bin/env python3
+"""
+Reads key events from virtual input devices (evdev) and sends them to the
+game window of each instance on X.
+
+    uv run --with python-xlib input_bridge.py /dev/input/event7 --window Heartopia_1
+
+Or one bridge process for every instance, attached and detached at runtime:
+
+    uv run --with python-xlib input_bridge.py serve
+    uv run input_bridge.py attach /dev/input/event7 --window Heartopia_1 --name 1
+    uv run input_bridge.py status
+    uv run input_bridge.py detach --name 1
+
+Everything runs on one thread around a selector (epoll on Linux) watching
+every device, every X connection and the control socket.
+"""
+
 import argparse
+import errno
+import fcntl
+import json
 import os
+import selectors
+import signal
+import socket
+import struct
 import sys
 import time
+from collections.abc import Callable
 
 import evdev
-from Xlib import X, display, error
-from Xlib.protocol import event as xevent
+from Xlib import display, error
 
+from event_log import RingLog
+from latency import RollingLatency
+from window_tracker import WindowTracker
+from x_injection import INJECTION_BACKENDS, make_injector
 
-def main():
-    parser = argparse.ArgumentParser(description="Bridge uinput events to X11 window.")
-    parser.add_argument("device_path", help="Path to input device")
-    parser.add_argument(
-        "--window", default="Heartopia", help="Target window name (WM_NAME)"
-    )
-    args = parser.parse_args()
+# Log levels (same values as the logging module)
+ERROR = 40
+WARNING = 30
+INFO = 20
+TRACE = 5
+LEVELS = {"error": ERROR, "warning": WARNING, "info": INFO, "trace": TRACE}
+LEVEL_NAMES = {v: k.upper() for k, v in LEVELS.items()}
 
-    device_path = args.device_path
-    target_window_name = args.window
+# RingLog record kinds
+LOG_MESSAGE = 1  # a = message slot, b = level, c = instance slot (-1: none)
+LOG_KEY = 2  # a = instance slot, b = X keycode, c = value (1 press, 0 release)
+LOG_SUMMARY = 3  # a = instance slot, b = events, c = errors
+LOG_LATENCY = 4  # a = instance slot, b = p50 in us, c = p99 in us
 
-    if not os.path.exists(device_path):
-        print(f"Error: Device {device_path} not found.")
-        sys.exit(1)
+# Largest latency a LOG_LATENCY record can carry (int32 microseconds)
+MAX_RECORD_US = 2**31 - 1
 
-    print(f"Bridge: Opening device {device_path}...", flush=True)
-    try:
-        dev = evdev.InputDevice(device_path)
-    except Exception as e:
-        print(f"Error opening device: {e}")
-        sys.exit(1)
-
-    # Connect to X Display (from env DISPLAY)
-    try:
-        d = display.Display()
-        print(f"Bridge: Connected to X Display {os.environ.get('DISPLAY')}", flush=True)
-    except Exception as e:
-        print(f"Error connecting to X display: {e}")
-        sys.exit(1)
-
-    print("Bridge: Listening for events...", flush=True)
+# Messages kept for the writer; older ones are overwritten if it falls this far behind
+MESSAGE_SLOTS = 1024
 
-    # Find the game window on the main display
-    root = d.screen().root
-    game_window = None
+COMMANDS = ("attach", "detach", "status", "shutdown")
 
-    def find_game_window(root_window=None):
-        if root_window is None:
-            root_window = root
+# _IOW('E', 0xa0, int): which clock evdev stamps this reader's events with
+EVIOCSCLOCKID = 0x400445A0
 
-        # Breadth-first search for better performance maybe? Or DFS is fine.
-        # We need to find the window named "Heartopia" which is NOT "Wine Desktop"
 
-        children = []
+def event_clock(fd: int) -> Callable[[], float]:
+    """
+    Switches the device's event timestamps to CLOCK_MONOTONIC (immune to
+    wall clock jumps) and returns the matching clock. Falls back to the
+    default CLOCK_REALTIME stamps and time.time if the ioctl fails.
+    """
+    try:
+        fcntl.ioctl(fd, EVIOCSCLOCKID, struct.pack("i", time.CLOCK_MONOTONIC))
+        return time.monotonic
+    except OSError:
+        return time.time
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", "/tmp")
+    return os.path.join(runtime_dir, "hertopia-bridge.sock")
+
+
+class BridgeLog:
+    """
+    Leveled logger for the bridge on top of RingLog.
+
+    Every call only stores integers (and, for messages, a reference to the
+    string) in preallocated buffers; formatting and the writes to the log
+    file happen on RingLog's writer thread. Per-key tracing is off unless
+    the level is "trace" or it is toggled on with SIGUSR1.
+
+    Like RingLog, it must only be used from the bridge's main thread. The
+    signal handler just flips a flag that the main loop picks up.
+    """
+
+    def __init__(
+        self,
+        sink=sys.stdout,
+        level: int = INFO,
+        summary_interval: float = 10.0,
+    ):
+        self.level = level
+        self.tracing = level <= TRACE
+        self._toggle_requested = False
+        self.messages: list[str] = [""] * MESSAGE_SLOTS
+        self._next_message = 0
+        # Instance names, indexed by the slot stored in the records
+        self.names: list[str] = []
+        self.ring = RingLog(self._format, sink, timestamps=True).start()
+
+        self.summary_interval = summary_interval
+        self._summary_start = time.monotonic()
+
+    def register(self, name: str) -> int:
+        """Returns the slot records of instance name are tagged with."""
+        if name in self.names:
+            return self.names.index(name)
+        self.names.append(name)
+        return len(self.names) - 1
+
+    def _source(self, slot: int) -> str:
+        return f"Bridge[{self.names[slot]}]" if slot >= 0 else "Bridge"
+
+    def _format(self, kind: int, a: int, b: int, c: int) -> str:
+        if kind == LOG_MESSAGE:
+            return f"{LEVEL_NAMES.get(b, b)} {self._source(c)}: {self.messages[a]}"
+        if kind == LOG_KEY:
+            action = "Press" if c == 1 else "Release"
+            return f"TRACE {self._source(a)}: {action} X keycode {b}"
+        if kind == LOG_SUMMARY:
+            interval = self.summary_interval
+            return (
+                f"INFO {self._source(a)}: {b} events ({b / interval:.1f}/s), "
+                f"{c} errors in the last {interval:.1f}s"
+            )
+        if kind == LOG_LATENCY:
+            return (
+                f"INFO {self._source(a)}: kernel -> X latency "
+                f"p50 {b / 1000:.3f} ms / p99 {c / 1000:.3f} ms"
+            )
+        return f"Bridge: unknown record {kind}"
+
+    def log(self, level: int, message: str, slot: int = -1) -> None:
+        if level < self.level and not (level == TRACE and self.tracing):
+            return
+        index = self._next_message % MESSAGE_SLOTS
+        self._next_message += 1
+        self.messages[index] = message
+        self.ring.record(LOG_MESSAGE, index, level, slot)
+
+    def error(self, message: str, slot: int = -1) -> None:
+        self.log(ERROR, message, slot)
+
+    def warning(self, message: str, slot: int = -1) -> None:
+        self.log(WARNING, message, slot)
+
+    def info(self, message: str, slot: int = -1) -> None:
+        self.log(INFO, message, slot)
+
+    def key(self, slot: int, x_keycode: int, value: int) -> None:
+        if self.tracing:
+            self.ring.record(LOG_KEY, slot, x_keycode, value)
+
+    def request_toggle(self, *_) -> None:
+        """SIGUSR1 handler: only sets a flag, the main loop does the rest."""
+        self._toggle_requested = True
+
+    def tick(self, instances) -> float:
+        """
+        Periodic work for the main loop: applies a pending trace toggle and
+        writes each instance's summary when due. Returns the seconds until
+        the next one.
+        """
+        if self._toggle_requested:
+            self._toggle_requested = False
+            self.tracing = not self.tracing
+            self.info(f"Tracing {'on' if self.tracing else 'off'}.")
+
+        now = time.monotonic()
+        elapsed = now - self._summary_start
+        if elapsed >= self.summary_interval:
+            for instance in instances:
+                events, errors = instance.take_summary()
+                if events or errors:
+                    self.ring.record(LOG_SUMMARY, instance.slot, events, errors)
+                if events:
+                    p = instance.latency.percentiles_ms()
+                    # Clamped to the record's int32 (a wall clock jump can
+                    # make realtime stamps look hours old)
+                    self.ring.record(
+                        LOG_LATENCY,
+                        instance.slot,
+                        min(int(p["p50"] * 1000), MAX_RECORD_US),
+                        min(int(p["p99"] * 1000), MAX_RECORD_US),
+                    )
+            self._summary_start = now
+            elapsed = 0.0
+        return self.summary_interval - elapsed
+
+    def close(self) -> None:
+        self.ring.close()
+
+
+class BridgeInstance:
+    """
+    One game instance: its input device, its own X connection and the
+    window tracker on it, and its counters.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        device_path: str,
+        target_name: str,
+        display_name: str | None,
+        log: BridgeLog,
+        backend: str = "sendevent",
+    ):
+        self.name = name
+        self.device_path = device_path
+        self.target_name = target_name
+        self.display_name = display_name
+        self.log = log
+        self.slot = log.register(name)
+
+        self.dev = evdev.InputDevice(device_path)
+        try:
+            self.display = display.Display(display_name)
+        except Exception:
+            self.dev.close()
+            raise
         try:
-            # Basic tree traversal
-            tree = root_window.query_tree()
-            children = tree.children
+            self.injector = make_injector(backend, self.display)
         except Exception:
-            return None
+            self.dev.close()
+            self.display.close()
+            raise
+        self.tracker = WindowTracker(self.display, target_name, self._on_window_change)
+        if self.tracker.window is None:
+            log.info(f"Waiting for '{target_name}' window...", self.slot)
+
+        # Kernel timestamp of each frame -> X flush, over the last frames
+        self.clock = event_clock(self.dev.fd)
+        self.latency = RollingLatency()
+
+        # Key events of the evdev frame being read, sent together at its SYN_REPORT
+        self.frame: list[tuple[int, int]] = []
+        # After SYN_DROPPED the kernel lost events: skip until the next SYN_REPORT
+        self.dropping = False
+
+        self.attached_at = time.monotonic()
+        # Whether the window was ever found, for Bridge.wait_timeout
+        self.window_seen = self.tracker.window is not None
+        self.events = 0  # Key events sent to X
+        self.frames = 0
+        self.lost = 0  # Keys that arrived while there was no window
+        self.syn_dropped = 0  # Kernel buffer overruns
+        self._lost_reported = 0
+        self._summary_events = 0
+        self._summary_errors = 0
+
+    def _on_window_change(self, window, name) -> None:
+        if window is not None:
+            self.window_seen = True
+            self.log.info(f"Target window: {name} (ID={hex(window.id)})", self.slot)
+        else:
+            self.log.warning(
+                "Game window is gone. Dropping keys until it is back.", self.slot
+            )
 
-        # Check children
-        for child in children:
+    def inject(self, x_keycode: int, value: int) -> None:
+        """Queues one key event on the X connection (sent on the next flush)."""
+        self.injector.key(self.tracker.window, x_keycode, value)
+        self.log.key(self.slot, x_keycode, value)
+
+    def read_device(self) -> None:
+        """
+        Drains everything already pending on the device, then flushes X once,
+        so a burst of frames (and every key of a chord) goes out together.
+        Raises OSError (ENODEV) when the device is gone.
+        """
+        frame = self.frame
+        pending = 0
+        # Kernel timestamps of the frames sent in this batch
+        stamps: list[float] = []
+        try:
+            while True:
+                for event in self.dev.read():
+                    if event.type == evdev.ecodes.EV_KEY:
+                        # 0 = Release, 1 = Press (2 = autorepeat, ignored)
+                        if event.value in (0, 1) and not self.dropping:
+                            # Linux input keycode to X11 keycode mapping is usually +8
+                            frame.append((event.code + 8, event.value))
+                    elif event.type == evdev.ecodes.EV_SYN:
+                        if event.code == evdev.ecodes.SYN_DROPPED:
+                            frame.clear()
+                            self.dropping = True
+                            self.syn_dropped += 1
+                            self.log.warning(
+                                "Events dropped by the kernel (SYN_DROPPED).", self.slot
+                            )
+                        elif event.code == evdev.ecodes.SYN_REPORT:
+                            if not self.dropping and frame:
+                                sent = self._send_frame(frame)
+                                if sent:
+                                    pending += sent
+                                    stamps.append(event.sec + event.usec / 1_000_000)
+                            frame.clear()
+                            self.dropping = False
+        except BlockingIOError:
+            # Nothing left to read
+            pass
+
+        if pending:
+            # Errors are asynchronous: a BadWindow for the target reaches
+            # the tracker's error handler, which drops the cached handle
+            self.injector.flush()
+            now = self.clock()
+            for stamp in stamps:
+                self.latency.add(now - stamp)
+            # flush() may have read events into Xlib's queue
+            self.tracker.process_events()
+
+    def _send_frame(self, frame: list[tuple[int, int]]) -> int:
+        self.frames += 1
+        if self.tracker.window is None and self.injector.needs_window:
+            # Stale keys are worse than missing ones
+            self.lost += len(frame)
+            return 0
+        if self.lost != self._lost_reported:
+            self.log.warning(
+                f"Dropped {self.lost - self._lost_reported} keys while there was no window.",
+                self.slot,
+            )
+            self._lost_reported = self.lost
+        for x_keycode, value in frame:
+            self.inject(x_keycode, value)
+        self.events += len(frame)
+        return len(frame)
+
+    def take_summary(self) -> tuple[int, int]:
+        """Events and errors since the previous call."""
+        events = self.events - self._summary_events
+        errors = self.tracker.errors - self._summary_errors
+        self._summary_events = self.events
+        self._summary_errors = self.tracker.errors
+        return events, errors
+
+    def status(self) -> dict:
+        window = self.tracker.window
+        uptime = time.monotonic() - self.attached_at
+        return {
+            "name": self.name,
+            "device": self.device_path,
+            "window": self.target_name,
+            "display": self.display_name,
+            "backend": self.injector.name,
+            "window_id": hex(window.id) if window is not None else None,
+            "uptime": uptime,
+            "events": self.events,
+            "events_per_second": self.events / uptime if uptime else 0.0,
+            "frames": self.frames,
+            "lost": self.lost,
+            "syn_dropped": self.syn_dropped,
+            "errors": self.tracker.errors,
+            "clock": "monotonic" if self.clock is time.monotonic else "realtime",
+            # Percentiles over the last latency_window frames
+            "latency_window": min(self.latency.count, self.latency.capacity),
+            "latency_ms": self.latency.percentiles_ms(),
+        }
+
+    def close(self) -> None:
+        self.log.info(
+            f"Totals: {self.events} events, {self.tracker.errors} errors, "
+            f"{self.lost} keys lost without a window.",
+            self.slot,
+        )
+        self.dev.close()
+        try:
+            self.display.close()
+        except error.ConnectionClosedError:
+            pass
+
+
+class Bridge:
+    """
+    Multiplexes any number of instances (and the control socket) on one
+    selector. Attach and detach happen between events on the same thread,
+    so nothing needs a lock.
+    """
+
+    def __init__(
+        self,
+        log: BridgeLog,
+        stats_dir: str | None = None,
+        stats_interval: float = 1.0,
+        wait_timeout: float | None = None,
+    ):
+        self.log = log
+        self.selector = selectors.DefaultSelector()
+        self.instances: dict[str, BridgeInstance] = {}
+        self.server: socket.socket | None = None
+        self.socket_path: str | None = None
+        self._running = True
+        # Each instance's status() is rewritten to stats_dir/bridge_<name>.json
+        self.stats_dir = stats_dir
+        self.stats_interval = stats_interval
+        self._stats_due = 0.0
+        # Instances that never find their window are detached after this long
+        self.wait_timeout = wait_timeout
+        self.timed_out = False
+
+    # --- Instances ---
+
+    def attach(
+        self,
+        name: str,
+        device_path: str,
+        target_name: str,
+        display_name: str | None = None,
+        backend: str = "sendevent",
+    ) -> dict:
+        if name in self.instances:
+            return {"ok": False, "error": f"Instance '{name}' is already attached."}
+        self.log.info(
+            f"Attaching {device_path} -> '{target_name}' on {display_name} ({backend})"
+        )
+        try:
+            instance = BridgeInstance(
+                name, device_path, target_name, display_name, self.log, backend
+            )
+        except Exception as e:
+            self.log.error(f"Could not attach '{name}': {e}")
+            return {"ok": False, "error": f"Could not attach '{name}': {e}"}
+        self.instances[name] = instance
+        self.selector.register(
+            instance.dev.fd, selectors.EVENT_READ, lambda: self._on_device(instance)
+        )
+        self.selector.register(
+            instance.display.fileno(),
+            selectors.EVENT_READ,
+            lambda: self._on_display(instance),
+        )
+        return {"ok": True}
+
+    def detach(self, name: str, reason: str = "Detached.") -> dict:
+        instance = self.instances.pop(name, None)
+        if instance is None:
+            return {"ok": False, "error": f"No instance named '{name}'."}
+        self.log.info(reason, instance.slot)
+        self.selector.unregister(instance.dev.fd)
+        self.selector.unregister(instance.display.fileno())
+        instance.close()
+        if self.stats_dir is not None:
+            # A stale file would look like an idle instance
             try:
-                wm_name = child.get_wm_name()
-                # Match strict name or Wine virtual desktop format
-                if wm_name and (
-                    wm_name == target_window_name
-                    or wm_name == f"{target_window_name} - Wine Desktop"
-                    or f"{target_window_name} -" in wm_name
-                ):
-                    return child
-
-                # If we find a window that might be it, but we want to be sure, we could check class.
-                # But exact name "Heartopia" is distinct from "Heartopia - Wine Desktop"
-            except Exception:
+                os.unlink(self._stats_path(name))
+            except FileNotFoundError:
                 pass
-
-        # Recurse
-        for child in children:
-            found = find_game_window(child)
-            if found:
-                return found
-
-        return None
-
-    # Wait for game window
-    print(f"Bridge: Waiting for '{target_window_name}' window...", flush=True)
-    for i in range(60):
-        # 1. Find the top-level container (Wine Desktop or just the window)
-        container = find_game_window()
-        if container:
-            # 2. If it's a Wine Desktop, we need to find the actual game window inside it.
-            # The game window usually has the name "Heartopia" (without suffix) and/or class "steam_proton".
-            # If target_window_name is "Heartopia_1", the container is found.
-            # But the child might be just "Heartopia".
-
-            print(
-                f"Bridge: Found Container search root: {container.get_wm_name()} (ID={hex(container.id)})",
-                flush=True,
-            )
-
-            # Helper to find the game window inside the container
-            def find_inner_game_window(parent):
-                try:
-                    children = parent.query_tree().children
-                except Exception:
-                    return None
-
-                for child in children:
-                    try:
-                        name = child.get_wm_name()
-                        # print(f"Bridge: Checking child: {name} (ID={hex(child.id)})", flush=True)
-                        if name == "Heartopia":  # The actual game name inside wine
-                            return child
-                        if name == "Heartopia_1":  # Maybe?
-                            return child
-                    except Exception:
-                        pass
-
-                    # Recurse
-                    found = find_inner_game_window(child)
-                    if found:
-                        return found
-                return None
-
-            # If the container ITSELF is the game (no suffix matched), use it.
-            # If matched via suffix, search children.
-            wm_name = container.get_wm_name()
-            if wm_name and "Wine Desktop" in wm_name:
-                print("Bridge: Searching for inner 'Heartopia' window...", flush=True)
-                inner = find_inner_game_window(container)
-                if inner:
-                    game_window = inner
-                    print(
-                        f"Bridge: Found Inner Game Window! ID={hex(game_window.id)} Name={game_window.get_wm_name()}",
-                        flush=True,
-                    )
-                    break
-                else:
-                    # Fallback to container if no child found yet (maybe starting up?)
-                    pass
+        return {"ok": True}
+
+    def _stats_path(self, name: str) -> str:
+        assert self.stats_dir is not None
+        return os.path.join(self.stats_dir, f"bridge_{name}.json")
+
+    def _write_stats(self) -> float:
+        """Rewrites the stats files when due; returns the seconds until the next time."""
+        now = time.monotonic()
+        if now < self._stats_due:
+            return self._stats_due - now
+        self._stats_due = now + self.stats_interval
+        for name, instance in self.instances.items():
+            path = self._stats_path(name)
+            try:
+                # Readers never see a half-written file
+                with open(path + ".tmp", "w") as f:
+                    json.dump(instance.status(), f, indent=2)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                self.log.error(f"Could not write {path}: {e}", instance.slot)
+        return self.stats_interval
+
+    def _expire_waiting(self) -> float:
+        """
+        Detaches instances still waiting for their first window after
+        wait_timeout; returns the seconds until the next one would expire.
+        """
+        assert self.wait_timeout is not None
+        now = time.monotonic()
+        timeout = self.wait_timeout
+        for name, instance in list(self.instances.items()):
+            if instance.window_seen:
+                continue
+            remaining = instance.attached_at + self.wait_timeout - now
+            if remaining <= 0:
+                self.log.error(
+                    f"Timed out waiting for '{instance.target_name}' window.",
+                    instance.slot,
+                )
+                self.timed_out = True
+                self.detach(name, "Gave up waiting for the window.")
             else:
-                # Direct match, use it
-                game_window = container
-                print(
-                    f"Bridge: Match is direct game window. ID={hex(game_window.id)}",
-                    flush=True,
+                timeout = min(timeout, remaining)
+        return timeout
+
+    def _on_device(self, instance: BridgeInstance) -> None:
+        # Detached earlier in this select batch; its fd is already closed
+        if self.instances.get(instance.name) is not instance:
+            return
+        try:
+            instance.read_device()
+        except OSError as e:
+            if e.errno == errno.ENODEV:
+                self.detach(instance.name, "Input device disconnected.")
+                return
+            # Only this instance goes down, never the shared loop
+            self.log.error(f"Input device read failed: {e}", instance.slot)
+            self.detach(instance.name, "Input device error.")
+        except error.ConnectionClosedError:
+            self.detach(instance.name, "X display connection closed.")
+
+    def _on_display(self, instance: BridgeInstance) -> None:
+        if self.instances.get(instance.name) is not instance:
+            return
+        try:
+            instance.tracker.process_events()
+        except OSError as e:
+            self.log.error(f"X display read failed: {e}", instance.slot)
+            self.detach(instance.name, "X display error.")
+        except error.ConnectionClosedError:
+            self.detach(instance.name, "X display connection closed.")
+
+    # --- Control socket ---
+
+    def status(self) -> dict:
+        return {
+            "ok": True,
+            "pid": os.getpid(),
+            "instances": [i.status() for i in self.instances.values()],
+        }
+
+    def shutdown(self) -> dict:
+        self._running = False
+        return {"ok": True}
+
+    def handle(self, request: object) -> dict:
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "Invalid request."}
+        command = request.get("command")
+        try:
+            if command == "attach":
+                return self.attach(
+                    str(request["name"]),
+                    request["device"],
+                    request["window"],
+                    request.get("display"),
+                    request.get("backend", "sendevent"),
                 )
-                break
+            if command == "detach":
+                return self.detach(str(request["name"]))
+        except (KeyError, TypeError):
+            return {"ok": False, "error": f"Invalid arguments for '{command}'."}
+        if command in COMMANDS:
+            return getattr(self, command)()
+        return {"ok": False, "error": f"Unknown command '{command}'."}
+
+    def listen(self, socket_path: str) -> bool:
+        if os.path.exists(socket_path):
+            # A leftover socket from a crashed bridge, unless one still answers
+            try:
+                send_command(socket_path, {"command": "status"})
+                print(f"Error: A bridge is already listening on {socket_path}.")
+                return False
+            except OSError:
+                os.unlink(socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen()
+        server.setblocking(False)
+        self.server = server
+        self.socket_path = socket_path
+        self.selector.register(server, selectors.EVENT_READ, self._accept)
+        self.log.info(f"Listening on {socket_path}")
+        return True
+
+    def _accept(self) -> None:
+        assert self.server is not None
+        try:
+            conn, _ = self.server.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        buffer = bytearray()
+        self.selector.register(
+            conn, selectors.EVENT_READ, lambda: self._on_request(conn, buffer)
+        )
+
+    def _on_request(self, conn: socket.socket, buffer: bytearray) -> None:
+        """Reads one JSON line without blocking the loop, then replies and closes."""
+        try:
+            chunk = conn.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b""
+        buffer += chunk
+        if chunk and b"\n" not in buffer:
+            return
+        self.selector.unregister(conn)
+        try:
+            request = json.loads(buffer.split(b"\n", 1)[0])
+        except ValueError:
+            request = None
+        try:
+            response = self.handle(request)
+        except Exception as e:
+            # One bad request must not leave the loop every instance runs on
+            self.log.error(f"Control request failed: {e!r}")
+            response = {"ok": False, "error": f"Request failed: {e}"}
+        try:
+            # Replies are small enough for the socket buffer
+            conn.sendall(json.dumps(response).encode() + b"\n")
+        except OSError:
+            pass
+        conn.close()
 
-        time.sleep(1)
+    # --- Main loop ---
 
-    if not game_window:
-        print("Bridge: Could not find game window. Exiting.", flush=True)
-        sys.exit(1)
+    def run(self, exit_when_empty: bool = False) -> None:
+        try:
+            while self._running:
+                if exit_when_empty and not self.instances:
+                    break
+                # Wake up for the summary even when no keys arrive
+                timeout = max(self.log.tick(self.instances.values()), 0)
+                if self.stats_dir is not None:
+                    timeout = min(timeout, self._write_stats())
+                if self.wait_timeout is not None:
+                    timeout = min(timeout, self._expire_waiting())
+                for key, _ in self.selector.select(timeout):
+                    key.data()
+        finally:
+            for name in list(self.instances):
+                self.detach(name, "Bridge stopping.")
+            if self.server is not None:
+                self.selector.unregister(self.server)
+                self.server.close()
+                if self.socket_path is not None:
+                    os.unlink(self.socket_path)
+            self.selector.close()
+
+
+def send_command(socket_path: str, request: dict) -> dict:
+    """Sends one JSON request to a running bridge and returns its reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        reply = sock.makefile("rb").readline()
+    return json.loads(reply)
+
+
+def print_status(status: dict) -> None:
+    print(f"Bridge PID {status['pid']}, {len(status['instances'])} instance(s)")
+    for i in status["instances"]:
+        window = i["window_id"] or "no window"
+        print(
+            f"  {i['name']}: {i['device']} -> '{i['window']}' ({window}) "
+            f"on {i['display']} via {i['backend']}"
+        )
+        print(
+            f"      {i['events']} events ({i['events_per_second']:.1f}/s), "
+            f"{i['errors']} errors, {i['lost']} lost, {i['syn_dropped']} SYN_DROPPED"
+        )
+        latency = i["latency_ms"]
+        print(
+            f"      kernel -> X ({i['clock']} clock, last {i['latency_window']} frames): "
+            f"p50 {latency['p50']:.3f} / p95 {latency['p95']:.3f} / "
+            f"p99 {latency['p99']:.3f} / max {latency['max']:.3f} ms"
+        )
 
-    try:
-        for event in dev.read_loop():
-            if event.type == evdev.ecodes.EV_KEY:
-                # Linux input keycode to X11 keycode mapping is usually +8
-                x_keycode = event.code + 8
-                print(
-                    f"Bridge: Read Event: Code={event.code}, Value={event.value} -> X Keycode={x_keycode}",
-                    flush=True,
-                )
 
-                # Send FocusIn event occasionally to trick game into thinking it has focus
-                # Doing this too often might flicker, but let's try just once or periodically?
+def main():
+    parser = argparse.ArgumentParser(description="Bridge uinput events to X11 window.")
+    parser.add_argument(
+        "target",
+        metavar="DEVICE|COMMAND",
+        help=f"Input device to bridge, or one of: serve, {', '.join(COMMANDS)}",
+    )
+    parser.add_argument("device", nargs="?", help="attach: input device")
+    parser.add_argument(
+        "--window", default="Heartopia", help="Target window name (WM_NAME)"
+    )
+    parser.add_argument(
+        "--display",
+        default=None,
+        help="X display of the instance (default: $DISPLAY)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=INJECTION_BACKENDS,
+        default="sendevent",
+        help="How keys reach X: XSendEvent to the window (default), XTEST "
+        "fake_input to the focused window, or nothing (null)",
+    )
+    parser.add_argument(
+        "--name", default=None, help="Instance name (default: the window name)"
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="Control socket (default: $XDG_RUNTIME_DIR/hertopia-bridge.sock for serve)",
+    )
+    parser.add_argument(
+        "--stats-dir",
+        default=None,
+        help="Keep DIR/bridge_<name>.json updated with each instance's counters and "
+        "kernel -> X latency percentiles",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=1.0,
+        help="Seconds between stats file updates (default: 1)",
+    )
+    parser.add_argument(
+        "--wait-timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Single-device mode: exit when the window has not appeared after "
+        "this long (default: wait forever)",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=list(LEVELS),
+        default="info",
+        help="'trace' logs every key; send SIGUSR1 to toggle tracing at runtime",
+    )
+    parser.add_argument(
+        "--summary-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between event/error summary lines (default: 10)",
+    )
+    args = parser.parse_args()
+    if args.wait_timeout is not None and args.wait_timeout <= 0:
+        parser.error("--wait-timeout must be positive")
+    if args.summary_interval <= 0:
+        parser.error("--summary-interval must be positive")
+    if args.stats_interval <= 0:
+        parser.error("--stats-interval must be positive")
+
+    display_name = args.display or os.environ.get("DISPLAY")
+    name = args.name or args.window
+
+    if args.target in COMMANDS:
+        socket_path = args.socket or default_socket_path()
+        request: dict = {"command": args.target}
+        if args.target == "attach":
+            if not args.device:
+                parser.error("attach needs an input device")
+            request.update(
+                name=name,
+                device=os.path.realpath(args.device),
+                window=args.window,
+                display=display_name,
+                backend=args.backend,
+            )
+        elif args.target == "detach":
+            request["name"] = name
+        try:
+            reply = send_command(socket_path, request)
+        except OSError as ex:
+            print(f"Error: Could not reach the bridge at {socket_path}: {ex}")
+            sys.exit(1)
+        if not reply.get("ok"):
+            print(f"Error: {reply.get('error')}")
+            sys.exit(1)
+        if args.target == "status":
+            print_status(reply)
+        return
+
+    serve = args.target == "serve"
+    if not serve and not os.path.exists(args.target):
+        print(f"Error: Device {args.target} not found.")
+        sys.exit(1)
 
-                try:
-                    focus_evt = xevent.FocusIn(
-                        display=d,
-                        window=game_window,
-                        detail=X.NotifyDetailNone,
-                        mode=X.NotifyNormal,
-                    )
+    log = BridgeLog(level=LEVELS[args.log_level], summary_interval=args.summary_interval)
+    signal.signal(signal.SIGUSR1, log.request_toggle)
+    # Let the finally blocks release devices, connections and the socket
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
 
-                    # 0 = Release, 1 = Press
-                    if event.value == 1:  # Press
-                        print(f"Bridge: Injecting Press {x_keycode}", flush=True)
-                        # Note: We removed the explicit FocusIn injection here as it might interfere
-                        # with the game's actual focus state and block physical input.
-                        # Since we target the inner window directly, standard events should work.
-
-                        event_obj = xevent.KeyPress(
-                            time=int(time.time()),
-                            root=root.id,
-                            window=game_window.id,
-                            same_screen=1,
-                            child=X.NONE,
-                            root_x=0,
-                            root_y=0,
-                            event_x=0,
-                            event_y=0,
-                            state=0,
-                            detail=x_keycode,
-                        )
-                        game_window.send_event(
-                            event_obj, propagate=False, event_mask=X.KeyPressMask
-                        )
-                        d.flush()
-
-                    elif event.value == 0:  # Release
-                        print(f"Bridge: Injecting Release {x_keycode}", flush=True)
-                        event_obj = xevent.KeyRelease(
-                            time=int(time.time()),
-                            root=root.id,
-                            window=game_window.id,
-                            same_screen=1,
-                            child=X.NONE,
-                            root_x=0,
-                            root_y=0,
-                            event_x=0,
-                            event_y=0,
-                            state=0,
-                            detail=x_keycode,
-                        )
-                        game_window.send_event(
-                            event_obj, propagate=False, event_mask=X.KeyReleaseMask
-                        )
-                        d.flush()
-                except error.XError as e:
-                    print(
-                        f"Bridge: X Protocol Error ({e}). Window might be gone.",
-                        flush=True,
-                    )
-                    game_window = None
-                    continue
-    except OSError as e:
-        if e.errno == 19:
-            print("Bridge: Input device disconnected. Exiting.", flush=True)
-        else:
-            raise
+    bridge = Bridge(
+        log,
+        args.stats_dir,
+        args.stats_interval,
+        wait_timeout=None if serve else args.wait_timeout,
+    )
+    try:
+        if serve or args.socket:
+            if not bridge.listen(args.socket or default_socket_path()):
+                sys.exit(1)
+        if not serve:
+            reply = bridge.attach(
+                name, args.target, args.window, display_name, args.backend
+            )
+            if not reply["ok"]:
+                sys.exit(1)
+        log.info("Listening for events...")
+        # A single-device bridge exits with its device, like before
+        bridge.run(exit_when_empty=not serve)
+        if bridge.timed_out:
+            sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
 
 
 if __name__ == "__main__":
@@ -1,17 +1,128 @@
+import heapq
+import os
+import struct
+import threading
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, Protocol, Sequence
 
 if TYPE_CHECKING:
     from evdev import UInput
 
-try:
-    from evdev import InputDevice as _InputDevice
-    from evdev import UInput as _UInput
-    from evdev import ecodes as e
-except ImportError:
-    _UInput = None
-    _InputDevice = None
-    e = None
+# Linux input event ABI constants, so nothing here needs evdev until a real
+# device is opened (importing evdev costs ~100 ms)
+EV_SYN = 0
+EV_KEY = 1
+SYN_REPORT = 0
+
+# struct input_event: timeval (ignored on write, the kernel stamps events), type, code, value
+INPUT_EVENT = struct.Struct("llHHi")
+
+
+class Sink(Protocol):
+    """Anything InputHandler can write events to in place of a uinput device."""
+
+    def write(self, etype: int, code: int, value: int) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class NullSink:
+    """Stand-in for a uinput device that discards every event (benchmarks, tests)."""
+
+    def write(self, etype: int, code: int, value: int) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class RecordingSink(NullSink):
+    """Stand-in for a uinput device that keeps (perf_counter, type, code, value) of every event."""
+
+    def __init__(self) -> None:
+        self.events: list[tuple[float, int, int, int]] = []
+
+    def write(self, etype: int, code: int, value: int) -> None:
+        self.events.append((time.perf_counter(), etype, code, value))
+
+
+class EventDeviceWriter:
+    """
+    Writes events straight to an existing /dev/input/eventX node.
+
+    Does what evdev's InputDevice.write does (one input_event per write)
+    without importing evdev.
+    """
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_WRONLY)
+
+    def write(self, etype: int, code: int, value: int) -> None:
+        os.write(self.fd, INPUT_EVENT.pack(0, 0, etype, code, value))
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class ReleaseWheel:
+    """
+    Single dispatcher thread that writes pending key releases at their due time.
+
+    Replaces one sleeping thread per tap: callers push (due, key_code) onto a
+    heap and the dispatcher wakes for the earliest one, so the thread count
+    stays at one no matter how dense the song is.
+    """
+
+    def __init__(self, release: Callable[[list[int]], None]):
+        self._release = release
+        self._heap: list[tuple[float, int, int]] = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+
+    def schedule(self, key_code: int, due: float) -> None:
+        """Queues a release of key_code at time.perf_counter() == due."""
+        with self._cond:
+            if self._stopped:
+                return
+            heapq.heappush(self._heap, (due, self._seq, key_code))
+            self._seq += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                remaining = self._heap[0][0] - time.perf_counter()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                due_keys: list[int] = []
+                now = time.perf_counter()
+                while self._heap and self._heap[0][0] <= now:
+                    due_keys.append(heapq.heappop(self._heap)[2])
+
+            # Write outside the condition so schedule() never waits on the device
+            self._release(due_keys)
+
+    def stop(self) -> None:
+        """Stops the dispatcher. Pending releases are dropped (cleanup releases all keys)."""
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
 
 
 class InputHandler:
@@ -25,22 +136,32 @@ class InputHandler:
         dry_run: bool = False,
         device_path: str | None = None,
         device_name: str = "HertopiaVirtualKeyboard",
+        sink: Sink | None = None,
     ):
         self.dry_run = dry_run
         self.ui: "UInput | None" = None
         self.key_mapping = key_mapping
         self._closed = False
         self._lock = None
+        self._release_wheel = ReleaseWheel(self._release_keys)
 
-        if not self.dry_run and _UInput and e:
+        if sink is not None:
+            # Write to an in-process sink instead of a real device
+            self.ui = sink  # type: ignore
+            self._lock = threading.Lock()
+        elif not self.dry_run:
             try:
-                import threading
-
                 self._lock = threading.Lock()
-                if device_path and _InputDevice:
+                if device_path:
                     # Connect to an existing device created by device_manager.py
-                    self.ui = _InputDevice(device_path)  # type: ignore
+                    self.ui = EventDeviceWriter(device_path)  # type: ignore
                 else:
+                    try:
+                        from evdev import UInput
+                    except ImportError:
+                        self._lock = None
+                        return
+
                     # Create a new UInput device
                     # UInput expects Dict[int, Sequence[int]] | None
                     # Flatten the values list because it might contain lists if multiple keys are mapped to one note
@@ -51,8 +172,8 @@ class InputHandler:
                         else:
                             vals.append(v)
 
-                    cap = {e.EV_KEY: vals}
-                    self.ui = _UInput(cap, name=device_name, version=0x1)
+                    cap = {EV_KEY: vals}
+                    self.ui = UInput(cap, name=device_name, version=0x1)
             except PermissionError:
                 print("Error: Permission denied. You must run this script with 'sudo'.")
                 raise
@@ -60,79 +181,117 @@ class InputHandler:
                 print(f"Error initializing input device: {ex}")
                 raise
 
-    def press(self, key_code: int, duration: float = 0.1) -> None:
-        """Simulates a key press with a specific duration."""
-        if self.dry_run or not self.ui or not e:
-            return
-
-        try:
-            with self._lock if self._lock else object():  # type: ignore
-                if self._closed:
-                    return
-                self.ui.write(e.EV_KEY, key_code, 1)  # Press # type: ignore
-                self.ui.write(e.EV_SYN, e.SYN_REPORT, 0)  # type: ignore
+    def press(self, key_code: int, duration: float = 0.1) -> float:
+        """
+        Simulates a key press with a specific duration.
 
-            time.sleep(duration)
+        The press is written immediately and the release is handed to the
+        release wheel, so this returns without sleeping. Returns the
+        time.perf_counter() at which the press was written.
+        """
+        if self.dry_run or not self.ui:
+            return time.perf_counter()
 
-            with self._lock if self._lock else object():  # type: ignore
-                if self._closed:
-                    return
-                self.ui.write(e.EV_KEY, key_code, 0)  # Release # type: ignore
-                self.ui.write(e.EV_SYN, e.SYN_REPORT, 0)  # type: ignore
-        except Exception as ex:
-            # If device is closed during sleep, we might get error, which is fine to ignore if we rely on cleanup
-            if not self.dry_run and not self._closed:
-                print(f"Error pressing key: {ex}")
+        written = self.write_batch([(key_code, 1)])
+        self._release_wheel.schedule(key_code, written + duration)
+        return written
 
     def key_down(self, key_code: int) -> None:
         """Simulates a key down event."""
-        if self.dry_run or not self.ui or not e:
+        if self.dry_run or not self.ui:
             return
 
         try:
             with self._lock if self._lock else object():  # type: ignore
                 if self._closed:
                     return
-                self.ui.write(e.EV_KEY, key_code, 1)  # type: ignore
-                self.ui.write(e.EV_SYN, e.SYN_REPORT, 0)  # type: ignore
+                self.ui.write(EV_KEY, key_code, 1)  # type: ignore
+                self.ui.write(EV_SYN, SYN_REPORT, 0)  # type: ignore
         except Exception as ex:
             if not self.dry_run and not self._closed:
                 print(f"Error key down: {ex}")
 
     def key_up(self, key_code: int) -> None:
         """Simulates a key up event."""
-        if self.dry_run or not self.ui or not e:
+        if self.dry_run or not self.ui:
             return
 
         try:
             with self._lock if self._lock else object():  # type: ignore
                 if self._closed:
                     return
-                self.ui.write(e.EV_KEY, key_code, 0)  # type: ignore
-                self.ui.write(e.EV_SYN, e.SYN_REPORT, 0)  # type: ignore
+                self.ui.write(EV_KEY, key_code, 0)  # type: ignore
+                self.ui.write(EV_SYN, SYN_REPORT, 0)  # type: ignore
         except Exception as ex:
             if not self.dry_run and not self._closed:
                 print(f"Error key up: {ex}")
 
+    def write_batch(self, transitions: Sequence[tuple[int, int]]) -> float:
+        """
+        Writes several key transitions as one evdev frame.
+
+        transitions is a sequence of (key_code, value) pairs, 1 = press and
+        0 = release. All of them go out under a single lock acquisition and
+        are closed by one SYN_REPORT, so the game sees a chord in one frame.
+
+        Returns the time.perf_counter() at which the frame was written (in
+        dry-run mode, when it would have been).
+        """
+        if self.dry_run or not self.ui or not transitions:
+            return time.perf_counter()
+
+        try:
+            with self._lock if self._lock else object():  # type: ignore
+                if self._closed:
+                    return time.perf_counter()
+                for key_code, value in transitions:
+                    self.ui.write(EV_KEY, key_code, value)  # type: ignore
+                self.ui.write(EV_SYN, SYN_REPORT, 0)  # type: ignore
+        except Exception as ex:
+            if not self.dry_run and not self._closed:
+                print(f"Error writing batch: {ex}")
+        return time.perf_counter()
+
+    def _release_keys(self, key_codes: list[int]) -> None:
+        self.write_batch([(key_code, 0) for key_code in key_codes])
+
     def cleanup(self) -> None:
         """Releases all keys and closes the UInput device."""
-        if self.dry_run or not self.ui or not e:
+        if self.dry_run or not self.ui:
             return
 
         if self._closed:
             return
 
+        self._release_wheel.stop()
         try:
             with self._lock if self._lock else object():  # type: ignore
                 self._closed = True
-                # Release all mapped keys to be safe
-                for k in self.key_mapping.values():
-                    if isinstance(k, list):
-                        for sub_k in k:
-                            self.ui.write(e.EV_KEY, sub_k, 0)
-                    else:
-                        self.ui.write(e.EV_KEY, k, 0)  # type: ignore
-                self.ui.write(e.EV_SYN, e.SYN_REPORT, 0)  # type: ignore
+                self._write_release_all()
                 self.ui.close()
         except Exception as ex:
             print(f"Error cleanup: {ex}")
+
+    def release_all(self) -> None:
+        """Releases every mapped key but keeps the device open (pause, song change)."""
+        if self.dry_run or not self.ui:
+            return
+
+        try:
+            with self._lock if self._lock else object():  # type: ignore
+                if self._closed:
+                    return
+                self._write_release_all()
+        except Exception as ex:
+            if not self._closed:
+                print(f"Error releasing keys: {ex}")
+
+    def _write_release_all(self) -> None:
+        # Release all mapped keys to be safe
+        for k in self.key_mapping.values():
+            if isinstance(k, list):
+                for sub_k in k:
+                    self.ui.write(EV_KEY, sub_k, 0)  # type: ignore
+            else:
+                self.ui.write(EV_KEY, k, 0)  # type: ignore
+        self.ui.write(EV_SYN, SYN_REPORT, 0)  # type: ignore
@@ -0,0 +1,188 @@
+from array import array
+from typing import Sequence
+
+from schedule import ACTION_PRESS, Schedule
+
+# Histogram bucket upper bounds, in milliseconds
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0)
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0-100) of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def format_percentiles(values: Sequence[float], unit: float = 1000.0) -> str:
+    """'p50 x / p95 y / p99 z / max w' in milliseconds (values in seconds)."""
+    ordered = sorted(values)
+    if not ordered:
+        return "no samples"
+    return (
+        " / ".join(
+            f"{name} {percentile(ordered, q) * unit:.3f}"
+            for name, q in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))
+        )
+        + " ms"
+    )
+
+
+def histogram(values: Sequence[float], width: int = 40) -> list[str]:
+    """Text histogram of values (seconds) over HISTOGRAM_BOUNDS_MS."""
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for v in values:
+        ms = v * 1000
+        for b, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if ms < bound:
+                counts[b] += 1
+                break
+        else:
+            counts[-1] += 1
+
+    peak = max(counts) or 1
+    lines = []
+    labels = [f"< {b:g} ms" for b in HISTOGRAM_BOUNDS_MS]
+    labels.append(f">= {HISTOGRAM_BOUNDS_MS[-1]:g} ms")
+    for label, count in zip(labels, counts):
+        bar = "#" * round(count / peak * width)
+        lines.append(f"  {label:>10} | {bar:<{width}} {count}")
+    return lines
+
+
+class RollingLatency:
+    """
+    The last capacity samples (seconds) in a preallocated ring, for
+    percentiles over recent activity in a long-running process.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self.samples: array[float] = array("d", bytes(8 * capacity))
+        self.count = 0  # Total samples ever added
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.samples[self.count % self.capacity] = value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentiles_ms(self) -> dict[str, float]:
+        """p50/p95/p99/max of the window, plus the all-time max, in ms."""
+        ordered = sorted(self.samples[: min(self.count, self.capacity)])
+        result = {
+            name: percentile(ordered, q) * 1000
+            for name, q in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))
+        }
+        result["max_ever"] = self.max * 1000
+        return result
+
+
+class LatencyRecorder:
+    """
+    Scheduled, write and release times of every press, in compact arrays.
+
+    All times are time.perf_counter() values. part/index point back at the
+    schedule entry so the report can name the bar and beat of bad passages.
+    """
+
+    def __init__(
+        self, schedules: Sequence[Schedule], labels: Sequence[str] | None = None
+    ):
+        self.schedules = list(schedules)
+        self.labels = list(labels) if labels else []
+        self.scheduled: array[float] = array("d")
+        self.written: array[float] = array("d")
+        self.released: array[float] = array("d")
+        self.parts: array[int] = array("H")
+        self.indices: array[int] = array("I")
+        # First frame's t0: pause, seek and set_rate re-anchor later frames, but
+        # the dump keeps one wall-clock timeline
+        self.t0: float | None = None
+        # (part, key_code) -> sample indices of presses not released yet, oldest first
+        self._open: dict[tuple[int, int], list[int]] = {}
+
+    def record(
+        self,
+        part: int,
+        entries: Sequence[int],
+        t0: float,
+        written: float,
+        rate: float = 1.0,
+    ) -> None:
+        """
+        Records one written frame: entries are indices into the part's schedule,
+        played at t0 + deadline / rate.
+        """
+        if self.t0 is None:
+            self.t0 = t0
+        schedule = self.schedules[part]
+        for j in entries:
+            key_code = schedule.codes[j]
+            if schedule.actions[j] == ACTION_PRESS:
+                n = len(self.scheduled)
+                self.scheduled.append(t0 + schedule.times[j] / rate)
+                self.written.append(written)
+                self.released.append(0.0)
+                self.parts.append(part)
+                self.indices.append(j)
+                self._open.setdefault((part, key_code), []).append(n)
+            else:
+                pending = self._open.get((part, key_code))
+                if pending:
+                    self.released[pending.pop(0)] = written
+
+    def lateness(self) -> list[float]:
+        return [w - s for s, w in zip(self.scheduled, self.written)]
+
+    def report(self, worst: int = 5) -> None:
+        count = len(self.scheduled)
+        if count == 0:
+            print("Latency: no presses recorded.")
+            return
+
+        lateness = self.lateness()
+        holds = [r - w for w, r in zip(self.written, self.released) if r > 0]
+
+        print(f"Latency report ({count} presses):")
+        print(f"  Press lateness: {format_percentiles(lateness)}")
+        if holds:
+            print(f"  Actual hold:    {format_percentiles(holds)}")
+        print("  Press lateness histogram:")
+        for line in histogram(lateness):
+            print(line)
+
+        # Worst passages: the latest press in each (part, bar)
+        bars: dict[tuple[int, int], tuple[float, int]] = {}
+        for n, late in enumerate(lateness):
+            part = self.parts[n]
+            bar, _ = self.schedules[part].bar_beat(self.indices[n])
+            if late > bars.get((part, bar), (-1.0, 0))[0]:
+                bars[(part, bar)] = (late, n)
+
+        print("  Worst passages:")
+        for (part, bar), (late, n) in sorted(
+            bars.items(), key=lambda item: item[1][0], reverse=True
+        )[:worst]:
+            _, beat = self.schedules[part].bar_beat(self.indices[n])
+            label = f"[{self.labels[part]}] " if self.labels else ""
+            print(f"    {label}bar {bar} beat {beat:.2f}: {late * 1000:.3f} ms late")
+
+    def dump(self, path: str) -> None:
+        """Writes the raw samples as CSV (times in seconds from playback start)."""
+        t0 = self.t0 or 0.0
+        with open(path, "w") as f:
+            f.write("part,bar,beat,scheduled,written,released,lateness_ms\n")
+            for n in range(len(self.scheduled)):
+                part = self.parts[n]
+                bar, beat = self.schedules[part].bar_beat(self.indices[n])
+                # Empty when playback stopped before the release was written
+                released = f"{self.released[n] - t0:.6f}" if self.released[n] else ""
+                f.write(
+                    f"{part},{bar},{beat:.3f},{self.scheduled[n] - t0:.6f},"
+                    f"{self.written[n] - t0:.6f},{released},"
+                    f"{(self.written[n] - self.scheduled[n]) * 1000:.4f}\n"
+                )
+        print(f"Latency samples written to {path}")
@@ -42,12 +42,22 @@ echo "Device created at: $DEVICE_PATH"
 echo "$DEVICE_PATH" > "$DEVICE_FILE"
 echo "Device PID: $DEVICE_PID"
 
+# If a shared bridge is running (input_bridge.py serve), attach to it instead
+# of starting a bridge process for this instance
+BRIDGE="uv run --directory $WORK_DIR --with python-xlib input_bridge.py"
+SHARED_BRIDGE=""
+if $BRIDGE status > /dev/null 2>&1; then
+    SHARED_BRIDGE=1
+    echo "Using the shared Input Bridge."
+fi
+
 # Cleanup on exit
 cleanup() {
     echo "Cleaning up Instance $INSTANCE_ID..."
     rm -f "$DEVICE_FILE"
     # Kill Bridge FIRST to avoid "No such device" error
     if [ ! -z "$BRIDGE_PID" ]; then kill $BRIDGE_PID 2>/dev/null; fi
+    if [ -n "$SHARED_BRIDGE" ]; then $BRIDGE detach --name "$INSTANCE_ID" > /dev/null 2>&1; fi
     # Kill Device Manager SECOND
     kill $DEVICE_PID 2>/dev/null
     # Kill Game if still running
@@ -57,15 +67,12 @@ cleanup() {
 }
 trap cleanup EXIT INT TERM
 
-# 2. Start Input Bridge (Background)
+# 2. Display environment (the Input Bridge starts once the window exists, below)
 # Explicitly target MAIN DISPLAY :0
 export DISPLAY=:0
 export WINE_BROWSER="/usr/bin/xdg-open"
 # Crucial for xdg-open to work from within Wine
 export DBUS_SESSION_BUS_ADDRESS="unix:path=/run/user/$(id -u)/bus"
-echo "Starting Input Bridge for window 'Heartopia_$INSTANCE_ID'..."
-uv run --with python-xlib input_bridge.py "$DEVICE_PATH" --window "Heartopia_$INSTANCE_ID" &
-BRIDGE_PID=$!
 
 # 3. Launch Game mimicking Heroic
 # Proton Configuration
@@ -160,12 +167,19 @@ fi
 
 echo "Window found: '$WINDOW_NAME'. Configuring monitoring..."
 
-echo "Starting Input Bridge for window '$WINDOW_NAME'..."
-# Log bridge output for debugging (in WORK_DIR)
-BRIDGE_LOG="$WORK_DIR/bridge_${INSTANCE_ID}.log"
-# Run uv from the project directory to ensure access to script and environment
-uv run --directory "$WORK_DIR" --with python-xlib input_bridge.py "$DEVICE_PATH" --window "$WINDOW_NAME" > "$BRIDGE_LOG" 2>&1 &
-BRIDGE_PID=$!
+if [ -n "$SHARED_BRIDGE" ]; then
+    echo "Attaching instance $INSTANCE_ID to the shared Input Bridge..."
+    $BRIDGE attach "$DEVICE_PATH" --window "$WINDOW_NAME" --name "$INSTANCE_ID" --display "$DISPLAY"
+else
+    echo "Starting Input Bridge for window '$WINDOW_NAME'..."
+    # Log bridge output for debugging (in WORK_DIR)
+    BRIDGE_LOG="$WORK_DIR/bridge_${INSTANCE_ID}.log"
+    # Run uv from the project directory to ensure access to script and environment
+    # bridge_<ID>.json in WORK_DIR has its live counters and latency percentiles
+    uv run --directory "$WORK_DIR" --with python-xlib input_bridge.py "$DEVICE_PATH" --window "$WINDOW_NAME" \
+        --name "$INSTANCE_ID" --stats-dir "$WORK_DIR" --wait-timeout 60 > "$BRIDGE_LOG" 2>&1 &
+    BRIDGE_PID=$!
+fi
 
 echo "Monitoring window '$WINDOW_NAME'..."
 while xwininfo -name "$WINDOW_NAME" > /dev/null 2>&1; do
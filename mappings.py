@@ -1,17 +1,19 @@
-try:
-    from evdev import ecodes as e
-except ImportError:
-    e = None
+from array import array
+from typing import cast
+
+from keycodes import KEY_NAMES, KEYCODES
 
 # --- Key Mapping Configuration ---
 
+# Bump whenever a mapping below (or how keys are picked from it) changes, so
+# cached compiled tapes are rebuilt
+MAPPING_VERSION = 2
+
 
-# Default to 0 if evdev is not present (for analysis/testing on non-linux)
-# This keeps the map definition valid but useless for playing
+# Codes come from the static table generated from evdev, so building the
+# mappings never imports evdev (and works without it, e.g. for analysis)
 def k(name: str) -> int:
-    if e:
-        return getattr(e, name, 0)
-    return 0
+    return KEYCODES.get(name, 0)
 
 
 KEYBOARD_MAPPING: dict[int, int] = {
@@ -109,11 +111,100 @@ DRUM_MAPPING: dict[int, int | list[int]] = {
 }
 
 
-KEY_NAMES: dict[int, str] = {}
-if e:
-    KEY_NAMES = {
-        v: n for n, v in e.ecodes.items() if isinstance(v, int) and n.startswith("KEY_")
-    }
+# --- Precomputed Lookup Tables ---
+
+# Octave-folding window per layout (drums map notes directly, no folding)
+LAYOUT_RANGES: dict[str, tuple[int, int] | None] = {
+    "keyboard": (48, 84),  # C3-C6
+    "guitar": (60, 84),  # C4-C6
+    "drums": None,
+}
+
+# Tables are indexed by note + TABLE_OFFSET so any MIDI note (0-127) shifted
+# by any transpose in [-128, 128) is a single index, without range checks;
+# table_index() brings larger shifts back into the table
+TABLE_OFFSET = 128
+TABLE_SIZE = 384
+
+
+def layout_mapping(layout: str) -> dict[int, int | list[int]]:
+    if layout == "guitar":
+        return cast(dict[int, int | list[int]], GUITAR_MAPPING)
+    if layout == "drums":
+        return DRUM_MAPPING
+    return cast(dict[int, int | list[int]], KEYBOARD_MAPPING)
+
+
+def fold_note(note: int, min_val: int, max_val: int) -> int:
+    """Shifts note by octaves until it fits within [min_val, max_val]."""
+    # Shift up if too low
+    while note < min_val:
+        note += 12
+    # Shift down if too high
+    while note > max_val:
+        note -= 12
+    return note
+
+
+def table_index(note: int) -> int:
+    """
+    Table index of a (transposed) note, moved by whole octaves into the table
+    when the note lies outside it.
+
+    Folding layouts give every octave of a pitch class beyond the table the
+    same key, and drums map nothing out there, so the row read is equivalent.
+    """
+    idx = note + TABLE_OFFSET
+    if idx < 0:
+        idx += -(idx // 12) * 12
+    elif idx >= TABLE_SIZE:
+        idx -= (idx - TABLE_SIZE) // 12 * 12 + 12
+    return idx
+
+
+class KeyTable:
+    """
+    Dense (transposed) note -> key lookup for one layout, folding applied.
+
+    For index note + TABLE_OFFSET:
+      folded  - the note after octave folding, or -1 if the layout can't play it
+      primary - its first key code, or 0
+      keys    - all its key codes (drums may alternate between several), or ()
+    """
+
+    def __init__(self, layout: str):
+        self.layout = layout
+        self.folded: array[int] = array("h", [-1] * TABLE_SIZE)
+        self.primary: array[int] = array("H", [0] * TABLE_SIZE)
+        self.keys: list[tuple[int, ...]] = [()] * TABLE_SIZE
+
+        mapping = layout_mapping(layout)
+        window = LAYOUT_RANGES.get(layout)
+        for idx in range(TABLE_SIZE):
+            note = idx - TABLE_OFFSET
+            if window is not None:
+                note = fold_note(note, *window)
+            val = mapping.get(note)
+            if val is None:
+                continue
+            keys = tuple(val) if isinstance(val, list) else (val,)
+            self.folded[idx] = note
+            self.primary[idx] = keys[0]
+            self.keys[idx] = keys
+
+    def __getitem__(self, note: int) -> tuple[int, ...]:
+        return self.keys[table_index(note)]
+
+
+_KEY_TABLES: dict[str, KeyTable] = {}
+
+
+def key_table(layout: str) -> KeyTable:
+    """Returns the (cached) lookup table for a layout."""
+    table = _KEY_TABLES.get(layout)
+    if table is None:
+        table = _KEY_TABLES[layout] = KeyTable(layout)
+    return table
 
 
 def get_key_name(key_code: int) -> str:
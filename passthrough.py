@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Live MIDI passthrough: plays the in-game instrument in real time from a MIDI
+controller (a mido input port) or from raw MIDI bytes on stdin or a FIFO.
+
+    uv run passthrough.py --port "USB MIDI Keyboard" --id 1
+    some-sequencer | uv run passthrough.py --stdin --layout drums --id 2
+    uv run passthrough.py --fifo /tmp/midi.fifo --dry-run
+
+Every note_on goes through the layout's lookup table straight to the
+InputHandler on the reading thread; the release is left to the release
+wheel. At the end the added latency (bytes read -> key written) is reported.
+"""
+
+import argparse
+import os
+import sys
+import time
+from array import array
+from typing import TYPE_CHECKING, BinaryIO
+
+from input_handler import InputHandler
+from latency import format_percentiles, histogram
+from mappings import key_table, layout_mapping, table_index
+from run_music import resolve_device_path
+
+if TYPE_CHECKING:
+    import mido
+
+NOTE_ON = 0x90
+
+# Data bytes of each channel message, by status high nibble
+CHANNEL_MESSAGE_LENGTHS = {
+    0x80: 2,
+    0x90: 2,
+    0xA0: 2,
+    0xB0: 2,
+    0xC0: 1,
+    0xD0: 1,
+    0xE0: 2,
+}
+
+
+class MidiByteParser:
+    """
+    Incremental parser for a raw MIDI byte stream.
+
+    Handles running status and skips SysEx, system common and real-time
+    bytes. feed() returns the complete channel messages in the chunk as
+    (status, data1, data2) tuples (data2 is 0 for one-byte messages).
+    """
+
+    def __init__(self) -> None:
+        self.status = 0
+        self.data: list[int] = []
+        self.in_sysex = False
+
+    def feed(self, chunk: bytes) -> list[tuple[int, int, int]]:
+        messages: list[tuple[int, int, int]] = []
+        data = self.data
+        for byte in chunk:
+            if byte >= 0xF8:
+                # Real-time bytes may appear anywhere, even inside a message
+                continue
+            if byte >= 0x80:
+                data.clear()
+                if byte == 0xF0:
+                    self.in_sysex = True
+                    self.status = 0
+                elif byte == 0xF7:
+                    self.in_sysex = False
+                elif byte >= 0xF0:
+                    # System common: cancels running status, its data is skipped
+                    self.in_sysex = False
+                    self.status = 0
+                else:
+                    self.in_sysex = False
+                    self.status = byte
+                continue
+            if self.in_sysex or not self.status:
+                continue
+            data.append(byte)
+            if len(data) == CHANNEL_MESSAGE_LENGTHS[self.status & 0xF0]:
+                messages.append((self.status, data[0], data[1] if len(data) > 1 else 0))
+                # Keep the status byte for running status
+                data.clear()
+        return messages
+
+
+class Passthrough:
+    """
+    Maps live notes to key presses and records the added latency of each.
+
+    received times are time.perf_counter() values taken as soon as the
+    message was read; latency is the time until the press was written.
+    """
+
+    def __init__(
+        self,
+        input_handler: InputHandler,
+        layout: str = "keyboard",
+        transpose: int = 0,
+        channel: int | None = None,
+        press_duration: float = 0.1,
+    ):
+        self.input_handler = input_handler
+        self.keys = key_table(layout).keys
+        self.transpose = transpose
+        self.channel = channel
+        self.press_duration = press_duration
+        self.latency: array[float] = array("d")
+        self.unmapped = 0
+        # Notes mapped to several keys (drums) go to the one idle longest
+        self._last_press: dict[int, float] = {}
+
+    def note_on(self, note: int, received: float) -> None:
+        keys = self.keys[table_index(note + self.transpose)]
+        if not keys:
+            self.unmapped += 1
+            return
+        if len(keys) == 1:
+            key_code = keys[0]
+        else:
+            last_press = self._last_press
+            key_code = min(keys, key=lambda k: last_press.get(k, float("-inf")))
+        written = self.input_handler.press(key_code, self.press_duration)
+        self._last_press[key_code] = written
+        self.latency.append(written - received)
+
+    def handle(self, status: int, note: int, velocity: int, received: float) -> None:
+        if status & 0xF0 != NOTE_ON or velocity == 0:
+            return
+        if self.channel is not None and status & 0x0F != self.channel:
+            return
+        self.note_on(note, received)
+
+    def run_stream(self, stream: BinaryIO) -> None:
+        """Reads raw MIDI bytes until EOF, handling each chunk as soon as it arrives."""
+        parser = MidiByteParser()
+        fd = stream.fileno()
+        while True:
+            # os.read returns whatever is available instead of filling a buffer
+            chunk = os.read(fd, 4096)
+            received = time.perf_counter()
+            if not chunk:
+                return
+            for status, data1, data2 in parser.feed(chunk):
+                self.handle(status, data1, data2, received)
+
+    def run_port(self, port: "mido.ports.BaseInput") -> None:
+        for msg in port:
+            received = time.perf_counter()
+            if msg.type == "note_on":
+                self.handle(NOTE_ON | msg.channel, msg.note, msg.velocity, received)
+
+    def report(self) -> None:
+        print(f"Passthrough: {len(self.latency)} notes, {self.unmapped} unmapped.")
+        if not self.latency:
+            return
+        print(f"  Added latency: {format_percentiles(self.latency)}")
+        for line in histogram(self.latency):
+            print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Play live MIDI as game keystrokes.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--port", help="mido input port name")
+    source.add_argument("--stdin", action="store_true", help="Raw MIDI bytes on stdin")
+    source.add_argument("--fifo", help="Raw MIDI bytes from this FIFO (or file)")
+    source.add_argument(
+        "--list-ports", action="store_true", help="List mido input ports and exit"
+    )
+    parser.add_argument(
+        "--layout", choices=["keyboard", "guitar", "drums"], default="keyboard"
+    )
+    parser.add_argument("--transpose", type=int, default=0, help="Transpose semitones")
+    parser.add_argument(
+        "--channel",
+        type=int,
+        default=None,
+        help="Only play this MIDI channel (1-16; default: all)",
+    )
+    parser.add_argument(
+        "--press-duration",
+        type=float,
+        default=100.0,
+        metavar="MS",
+        help="How long each key is held (default: 100)",
+    )
+    parser.add_argument("--id", type=int, default=None, help="Target instance ID")
+    parser.add_argument("--device-path", default=None)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Map notes but don't press keys"
+    )
+    args = parser.parse_args()
+
+    if args.list_ports:
+        import mido
+
+        for name in mido.get_input_names():
+            print(name)
+        return
+
+    if not -127 <= args.transpose <= 127:
+        parser.error("--transpose must be between -127 and 127")
+    if args.channel is not None and not 1 <= args.channel <= 16:
+        parser.error("--channel must be between 1 and 16")
+
+    device_path = args.device_path or resolve_device_path(args.id)
+    input_handler = InputHandler(
+        layout_mapping(args.layout), dry_run=args.dry_run, device_path=device_path
+    )
+    passthrough = Passthrough(
+        input_handler,
+        layout=args.layout,
+        transpose=args.transpose,
+        channel=args.channel - 1 if args.channel is not None else None,
+        press_duration=args.press_duration / 1000,
+    )
+
+    print("Passing notes through. Press Ctrl+C to stop.", file=sys.stderr)
+    try:
+        if args.port:
+            import mido
+
+            with mido.open_input(args.port) as port:
+                passthrough.run_port(port)
+        elif args.stdin:
+            passthrough.run_stream(sys.stdin.buffer)
+        else:
+            with open(args.fifo, "rb", buffering=0) as fifo:
+                passthrough.run_stream(fifo)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    except (OSError, ImportError) as ex:
+        print(f"Error opening MIDI input: {ex}")
+    finally:
+        passthrough.report()
+        print("Releasing all keys...")
+        input_handler.cleanup()
+        print("Done.")
+
+
+if __name__ == "__main__":
+    main()
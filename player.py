@@ -1,12 +1,19 @@
-import threading
 import time
-from typing import cast
+from typing import TYPE_CHECKING
 
-import mido
-from mido import Message
+import startup
+from input_handler import InputHandler, Sink
+from engine import Timeline, Transport, make_note_log, report_latency
+from event_log import RingLog
+from latency import LatencyRecorder
+from mappings import layout_mapping
+from rate_limit import enforce_retrigger_interval
+from schedule import Schedule, compile_schedule
+from tape_cache import TapeCache, tape_key
+from timing import make_timer
 
-from input_handler import InputHandler
-from mappings import DRUM_MAPPING, GUITAR_MAPPING, KEYBOARD_MAPPING, get_key_name
+if TYPE_CHECKING:
+    import mido
 
 
 class MidiPlayer:
@@ -18,35 +25,92 @@ class MidiPlayer:
         dry_run: bool = False,
         layout: str = "keyboard",
         device_path: str | None = None,
+        timing: str = "sleep",
+        spin_threshold: float = 0.002,
+        midi: "mido.MidiFile | None" = None,
+        tape_cache: TapeCache | None = None,
+        quiet: bool = False,
+        log_file: str | None = None,
+        latency_report: bool = False,
+        latency_dump: str | None = None,
+        sink: Sink | None = None,
+        countdown: int = 3,
+        min_retrigger: float = 0.0,
+        input_handler: InputHandler | None = None,
     ):
         self.midi_file = midi_file
+        # Optional already-loaded (e.g. split in memory) MIDI; midi_file is then just a label
+        self.midi = midi
+        self.tape_cache = tape_cache
         self.speed = speed
         self.transpose = transpose
         self.dry_run = dry_run
         self.layout = layout
         self.device_path = device_path
-
-        self.current_mapping: dict[int, int | list[int]]
-        if layout == "guitar":
-            self.current_mapping = cast(dict[int, int | list[int]], GUITAR_MAPPING)
-        elif layout == "drums":
-            self.current_mapping = DRUM_MAPPING
-        else:
-            self.current_mapping = cast(dict[int, int | list[int]], KEYBOARD_MAPPING)
-        self.input_handler = InputHandler(
-            self.current_mapping, dry_run=dry_run, device_path=device_path
+        self.timer = make_timer(timing, spin_threshold)
+        self.quiet = quiet
+        self.log_file = log_file
+        # Built by start(): the engine and daemon play with their own log
+        self.log: RingLog | None = None
+        self.latency_report = latency_report
+        self.latency_dump = latency_dump
+        self.latency: LatencyRecorder | None = None
+
+        self.current_mapping = layout_mapping(layout)
+        # An already-open handler (the daemon keeps one device across songs)
+        self.input_handler = input_handler or InputHandler(
+            self.current_mapping, dry_run=dry_run, device_path=device_path, sink=sink
         )
+        self.countdown = countdown
         self.running = False
-        self.active_notes: dict[int, int] = {}
         self.guitar_sustain_extension = 0.1
-        self.drum_alternation_index: dict[int, int] = {}
+        self.press_duration = (
+            self.guitar_sustain_extension if layout == "guitar" else 0.1
+        )
+        # Minimum time between two presses of the same key (0 disables the limiter)
+        self.min_retrigger = min_retrigger
+        self.schedule: Schedule | None = None
+        # Set while playing; pause/resume/seek/set_speed act on it
+        self.transport: Transport | None = None
+
+    def prepare(self) -> bool:
+        """
+        Loads the MIDI file and compiles it into self.schedule.
+
+        With a tape cache, a previously compiled tape for the same file and
+        settings is memory-mapped instead, skipping mido entirely.
+        """
+        key = None
+        if self.midi is None and self.tape_cache is not None:
+            try:
+                key = tape_key(
+                    self.midi_file,
+                    self.layout,
+                    self.transpose,
+                    self.speed,
+                    self.press_duration,
+                    self.min_retrigger,
+                )
+            except FileNotFoundError:
+                print(f"Error: File '{self.midi_file}' not found.")
+                return False
 
-    def start(self) -> None:
-        try:
-            mid = mido.MidiFile(self.midi_file)
-        except FileNotFoundError:
-            print(f"Error: File '{self.midi_file}' not found.")
-            return
+            cached = self.tape_cache.load(key)
+            if cached is not None:
+                self.schedule, self.transpose = cached
+                print(f"Loaded compiled tape from cache ({len(self.schedule)} events).")
+                return True
+
+        import mido
+
+        if self.midi is not None:
+            mid = self.midi
+        else:
+            try:
+                mid = mido.MidiFile(self.midi_file)
+            except FileNotFoundError:
+                print(f"Error: File '{self.midi_file}' not found.")
+                return False
 
         # Auto-Transpose Logic
         if self.layout == "guitar":
@@ -57,186 +121,133 @@ class MidiPlayer:
                 )
                 self.transpose += optimal_transpose
 
+        self.schedule = compile_schedule(
+            mid,
+            layout=self.layout,
+            transpose=self.transpose,
+            speed=self.speed,
+            press_duration=self.press_duration,
+        )
+        if self.min_retrigger > 0:
+            self.schedule, report = enforce_retrigger_interval(
+                self.schedule, self.min_retrigger
+            )
+            report.print()
+        if key is not None and self.tape_cache is not None:
+            self.tape_cache.store(key, self.schedule, self.transpose)
+        return True
+
+    def start(self, position: float = 0.0, bar: int | None = None) -> None:
+        """
+        Plays the song, from position seconds (of the compiled schedule) or
+        from the start of bar if given.
+        """
+        # prepare() may already have been called (e.g. to time compilation)
+        if self.schedule is None and not self.prepare():
+            return
+        startup.mark("song compiled")
+
+        if self.dry_run and self.schedule is not None:
+            self.schedule.dump()
+
         print(f"Playing '{self.midi_file}'...")
         print(
             f"Speed: {self.speed}x, Transpose: {self.transpose} semitones, Layout: {self.layout}"
         )
         print("Press Ctrl+C to stop.")
 
-        print("Starting in 3 seconds... Switch to your game window NOW!")
-        for i in range(3, 0, -1):
-            print(f"{i}...")
-            time.sleep(1)
+        if self.countdown > 0:
+            print(
+                f"Starting in {self.countdown} seconds... Switch to your game window NOW!"
+            )
+            countdown_start = time.perf_counter()
+            for i in range(self.countdown, 0, -1):
+                print(f"{i}...")
+                time.sleep(1)
+            startup.exclude(time.perf_counter() - countdown_start)
 
         self.running = True
+        self.log = make_note_log(quiet=self.quiet, log_file=self.log_file).start()
         try:
-            for msg in mid:
-                if not self.running:
-                    break
-
-                if not hasattr(msg, "time"):
-                    continue
-
-                # Retrieve message time and sleep if needed
-                time_to_wait = msg.time / self.speed
-                if time_to_wait > 0:
-                    time.sleep(time_to_wait)
-
-                if getattr(msg, "is_meta", False):
-                    continue
-
-                if msg.type in ["note_on", "note_off"]:
-                    if isinstance(msg, Message):
-                        self._handle_note_msg(msg)
-
+            self._play(position, bar)
         except KeyboardInterrupt:
             print("\nStopping...")
         finally:
             self.stop()
 
-    def _calculate_best_transpose(self, mid: mido.MidiFile) -> int:
-        """Calculates the transposition that maximizes diatonic (white key) notes."""
-        # Valid pitch classes for C Major / A Minor (White Keys)
-        # C, D, E, F, G, A, B -> 0, 2, 4, 5, 7, 9, 11
-        VALID_CLASSES = {0, 2, 4, 5, 7, 9, 11}
+    def _play(self, position: float = 0.0, bar: int | None = None) -> None:
+        """Writes every schedule entry at its absolute deadline."""
+        schedule = self.schedule
+        if schedule is None:
+            return
 
-        pitch_counts = {i: 0 for i in range(12)}
-        total_notes = 0
+        if self.latency_report or self.latency_dump:
+            self.latency = LatencyRecorder([schedule])
+
+        # Deadlines are absolute offsets from t0 on a monotonic clock, so sleep
+        # overshoot on one event never pushes back the ones after it.
+        transport = Transport(
+            Timeline([schedule]),
+            [self.input_handler],
+            self.timer,
+            self.log,
+            self.latency,
+        )
+        if bar is not None:
+            transport.seek_bar(bar)
+        elif position > 0:
+            transport.seek(position)
+        self.transport = transport
+        startup.mark("first event scheduled")
+        transport.play()
 
-        for track in mid.tracks:
-            for msg in track:
-                if msg.type == "note_on" and msg.velocity > 0:
-                    total_notes += 1
-                    pitch_counts[msg.note % 12] += 1
+    # --- Live control (from another thread while start() plays) ---
 
-        if total_notes == 0:
-            return 0
+    def pause(self) -> bool:
+        return self.transport is not None and self.transport.pause()
 
-        best_transpose = 0
-        best_hits = -1
-
-        for t in range(12):
-            hits = 0
-            for pitch, count in pitch_counts.items():
-                shifted = (pitch + t) % 12
-                if shifted in VALID_CLASSES:
-                    hits += count
-
-            if hits > best_hits:
-                best_hits = hits
-                best_transpose = t
-
-        # If the best transpose is just 0 (or equivalent 12), return 0
-        # If it improves coverage effectively, return it.
-        # Check current coverage
-        current_hits = 0
-        for pitch, count in pitch_counts.items():
-            if pitch in VALID_CLASSES:
-                current_hits += count
-
-        if best_hits > current_hits:
-            # Normalize to -6 to +5 range for cleaner output?
-            # Or just 0-11. Let's keep 0-11 as positive shift.
-            return best_transpose
+    def resume(self) -> bool:
+        return self.transport is not None and self.transport.resume()
 
-        return 0
+    def seek(self, seconds: float) -> None:
+        if self.transport is not None:
+            self.transport.seek(seconds)
 
-    def _handle_note_msg(self, msg: Message) -> None:
-        note_val = msg.note
-        velocity = msg.velocity
-        msg_type = msg.type
-
-        note = note_val + self.transpose
-
-        if self.layout == "keyboard":
-            self._handle_keyboard_layout(note, velocity, msg_type)
-        elif self.layout == "guitar":
-            self._handle_guitar_layout(note, velocity, msg_type)
-        elif self.layout == "drums":
-            self._handle_drum_layout(note, velocity, msg_type)
-
-    def _handle_keyboard_layout(self, note: int, velocity: int, msg_type: str) -> None:
-        # Keyboard Logic: Fire-and-Forget for Note On
-        if msg_type == "note_on" and velocity > 0:
-            # Fold note to fit in Keyboard range (C3-C6 -> 48-84)
-            effective_note = self._fold_note(note, 48, 84)
-
-            if effective_note in self.current_mapping:
-                val = self.current_mapping[effective_note]
-                key_code = val[0] if isinstance(val, list) else val
-                key_name = get_key_name(key_code)
-                print(f"Note {note} (Folded to {effective_note}) -> Key '{key_name}'")
-
-                # Asynchronous press to not block MIDI processing
-                t = threading.Thread(
-                    target=self.input_handler.press, args=(key_code, 0.1)
-                )
-                t.daemon = True
-                t.start()
-
-    def _handle_guitar_layout(self, note: int, velocity: int, msg_type: str) -> None:
-        # Guitar Logic: Fold note to fit in Guitar range (C4-C6 -> 60-84)
-        effective_note = self._fold_note(note, 60, 84)
-        original_note = note
-
-        # Guitar Mode Tap Logic: Fire-and-forget, ignore note_off
-        if msg_type == "note_on" and velocity > 0:
-            if effective_note in self.current_mapping:
-                val = self.current_mapping[effective_note]
-                key_code = val[0] if isinstance(val, list) else val
-                key_name = get_key_name(key_code)
-                print(
-                    f"Note ON {original_note} (Folded to {effective_note}) -> Key '{key_name}'"
-                )
+    def seek_bar(self, bar: int) -> None:
+        if self.transport is not None:
+            self.transport.seek_bar(bar)
 
-                t = threading.Thread(
-                    target=self.input_handler.press, args=(key_code, 0.1)
-                )
-                t.daemon = True
-                t.start()
-
-    def _handle_drum_layout(self, note: int, velocity: int, msg_type: str) -> None:
-        # Drum Logic: Direct mapping, no folding, fire-and-forget
-        if msg_type == "note_on" and velocity > 0:
-            if note in self.current_mapping:
-                mapped_val = self.current_mapping[note]
-
-                # Handle single int or list of ints (alternating)
-                if isinstance(mapped_val, list):
-                    # Get current index for this note, default to 0
-                    idx = self.drum_alternation_index.get(note, 0)
-                    key_code = mapped_val[idx % len(mapped_val)]
-                    # Increment for next time
-                    self.drum_alternation_index[note] = idx + 1
-                else:
-                    key_code = mapped_val
-
-                key_name = get_key_name(key_code)
-                print(f"Drum Hit {note} -> Key '{key_name}'")
-
-                t = threading.Thread(
-                    target=self.input_handler.press, args=(key_code, 0.1)
-                )
-                t.daemon = True
-                t.start()
-
-    def _fold_note(self, note: int, min_val: int, max_val: int) -> int:
-        """Shifts note by octaves until it fits within [min_val, max_val]."""
-        # Shift up if too low
-        while note < min_val:
-            note += 12
-        # Shift down if too high
-        while note > max_val:
-            note -= 12
-        return note
-
-    def _release_key_delayed(self, key_code: int, delay: float, note: int) -> None:
-        time.sleep(delay)
-        self.input_handler.key_up(key_code)
-        print(f"Note OFF {note} -> Key '{get_key_name(key_code)}' (Released)")
+    def set_speed(self, speed: float) -> None:
+        """Plays on at speed (same scale as the speed argument) without recompiling."""
+        if self.transport is not None:
+            self.transport.set_rate(speed / self.speed)
+
+    def _calculate_best_transpose(self, mid: "mido.MidiFile") -> int:
+        """Calculates the transposition (0-11) that maximizes playable guitar notes."""
+        import numpy as np
+
+        from transpose_fit import TransposeFit, pitch_histogram
+
+        fit = TransposeFit(pitch_histogram(mid), self.layout, np.arange(12))
+        if fit.total == 0:
+            return 0
+
+        # Only transpose if it actually improves coverage over the original key;
+        # among equally playable shifts, TransposeFit.ranking prefers more notes
+        # inside the range unfolded, then fewer fold collisions
+        best = fit.best()
+        if fit.playable[fit.at(best)] > fit.playable[fit.at(0)]:
+            return best
+        return 0
 
     def stop(self) -> None:
         self.running = False
+        if self.transport is not None:
+            self.transport.stop()
+        if self.log is not None:
+            self.log.close()
+        print(self.timer.stats.summary())
+        report_latency(self.latency, self.latency_report, self.latency_dump)
         print("Releasing all keys...")
         self.input_handler.cleanup()
         print("Done.")
@@ -0,0 +1,98 @@
+from mappings import get_key_name
+from schedule import ACTION_PRESS, ACTION_RELEASE, Schedule
+
+
+class RetriggerReport:
+    """What enforce_retrigger_interval changed, one entry per affected press."""
+
+    def __init__(self) -> None:
+        # (kind, time, note, key_code); kind is "shortened", "merged" or "dropped"
+        self.changes: list[tuple[str, float, int, int]] = []
+
+    def add(self, kind: str, t: float, note: int, key_code: int) -> None:
+        self.changes.append((kind, t, note, key_code))
+
+    def count(self, kind: str) -> int:
+        return sum(1 for change in self.changes if change[0] == kind)
+
+    def print(self, limit: int = 10) -> None:
+        if not self.changes:
+            return
+        print(
+            f"Re-trigger limit: {self.count('shortened')} holds shortened, "
+            f"{self.count('merged')} simultaneous notes merged, "
+            f"{self.count('dropped')} notes dropped."
+        )
+        for kind, t, note, key_code in sorted(self.changes, key=lambda c: c[1])[:limit]:
+            print(
+                f"  {t:9.3f}s  {kind:<9}  note {note}  key '{get_key_name(key_code)}'"
+            )
+        if len(self.changes) > limit:
+            print(f"  ... and {len(self.changes) - limit} more")
+
+
+def enforce_retrigger_interval(
+    schedule: Schedule,
+    min_interval: float,
+    per_key: dict[int, float] | None = None,
+) -> tuple[Schedule, RetriggerReport]:
+    """
+    Makes every key re-trigger no faster than the game can register.
+
+    For each key, presses closer than min_interval (or per_key[key_code])
+    to the previous kept press are merged (same instant) or dropped. Holds
+    are shortened so each release lands at least half the interval before
+    the key's next press, which leaves both the hold and the key-up gap at
+    least min_interval / 2 long.
+    """
+    report = RetriggerReport()
+
+    # Pair each press with its release, per key, in order
+    presses: dict[int, list[int]] = {}
+    releases: dict[int, list[int]] = {}
+    for i in range(len(schedule)):
+        target = presses if schedule.actions[i] == ACTION_PRESS else releases
+        target.setdefault(schedule.codes[i], []).append(i)
+
+    out = Schedule()
+    out.beats_per_bar = schedule.beats_per_bar
+    times = schedule.times
+
+    for key_code, key_presses in presses.items():
+        interval = (per_key or {}).get(key_code, min_interval)
+        key_releases = releases.get(key_code, [])
+
+        # [press index, release time, release index]
+        kept: list[list] = []
+        for n, p in enumerate(key_presses):
+            r = key_releases[n] if n < len(key_releases) else p
+            t = times[p]
+            if kept:
+                prev = kept[-1]
+                since = t - times[prev[0]]
+                if since < interval:
+                    kind = "merged" if since == 0 else "dropped"
+                    report.add(kind, t, schedule.notes[p], key_code)
+                    continue
+                latest_release = t - interval / 2
+                if prev[1] > latest_release:
+                    prev[1] = latest_release
+                    report.add(
+                        "shortened", times[prev[0]], schedule.notes[prev[0]], key_code
+                    )
+            kept.append([p, times[r], r])
+
+        for p, release_time, r in kept:
+            out.append(
+                times[p], key_code, ACTION_PRESS, schedule.notes[p], schedule.beats[p]
+            )
+            out.append(
+                release_time,
+                key_code,
+                ACTION_RELEASE,
+                schedule.notes[r],
+                schedule.beats[r],
+            )
+
+    out.sort()
+    return out, report
@@ -1,12 +1,160 @@
+import sys
+
+# Must come before the other imports so they are timed too
+if "--startup-profile" in sys.argv:
+    import startup
+
+    startup.enable()
+
 import argparse
 import os
+from typing import TYPE_CHECKING
 
+import startup
+from engine import PlaybackEngine
 from player import MidiPlayer
+from tape_cache import DEFAULT_CACHE_DIR, TapeCache
+from timing import TIMING_MODES
+
+if TYPE_CHECKING:
+    from x_injection import XDirectSink
+
+
+def resolve_device_path(instance_id: int | None) -> str | None:
+    """Reads the device path written by launcher.sh to .device_<ID>."""
+    device_path = None
+    if instance_id is not None:
+        # Try to read from .device_<ID> file
+        device_file = f".device_{instance_id}"
+        try:
+            with open(device_file, "r") as f:
+                content = f.read().strip()
+                if os.path.exists(content):
+                    device_path = content
+                    print(
+                        f"Auto-detected device path for Instance {instance_id}: {device_path}"
+                    )
+                else:
+                    print(
+                        f"Warning: Stale device file found. Path '{content}' does not exist."
+                    )
+                    print(f"Is Instance {instance_id} running?")
+                    # We could fallback to None (Global) or exit.
+                    # If the user specifically asked for ID 1, failing is probably better than guessing?
+                    # But existing behavior for "file not found" was "pass" (uses global).
+                    # Let's stick to "pass" but with the warning.
+        except FileNotFoundError:
+            print(
+                f"Warning: Could not find '{device_file}'. Using standard global input."
+            )
+            pass
+    else:
+        # No ID and No Device Path -> Standard Input (Global UInput)
+        print("No instance ID or device path specified. Using standard global input.")
+        pass
+    return device_path
+
+
+def open_x_sink(
+    instance_id: int | None, args: argparse.Namespace
+) -> "XDirectSink | None":
+    """
+    --output x: a sink that injects straight into the instance's game window
+    (no uinput, no bridge process). Returns None, so the player falls back
+    to the input device, when the display or the window can't be reached.
+    """
+    if args.output != "x" or args.dry_run:
+        return None
+    from x_injection import XDirectSink
+
+    window = args.x_window or (
+        f"Heartopia_{instance_id}" if instance_id is not None else "Heartopia"
+    )
+    try:
+        sink = XDirectSink(window, args.x_display, args.x_backend)
+    except Exception as ex:
+        print(f"Warning: Could not open the X display ({ex}). Using the input device.")
+        return None
+    if sink.window is None and sink.injector.needs_window:
+        print(f"Warning: Window '{window}' not found. Using the input device.")
+        sink.close()
+        return None
+    print(f"Injecting directly into '{window}' via {args.x_backend}.")
+    return sink
+
+
+def parse_part(spec: str) -> tuple[int, str, str]:
+    """Parses an 'ID:LAYOUT:FILE' --part argument."""
+    try:
+        instance_id, layout, midi_file = spec.split(":", 2)
+        if layout not in ("keyboard", "guitar", "drums"):
+            raise ValueError
+        return int(instance_id), layout, midi_file
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Invalid part '{spec}'. Expected ID:LAYOUT:FILE, e.g. 2:drums:song.mid"
+        )
+
+
+def parse_assignment(spec: str) -> tuple[int, int, str]:
+    """Parses a 'CHANNEL:ID:LAYOUT' --ensemble argument (channel is 1-16)."""
+    try:
+        channel, instance_id, layout = spec.split(":")
+        if layout not in ("keyboard", "guitar", "drums") or not 1 <= int(channel) <= 16:
+            raise ValueError
+        return int(channel), int(instance_id), layout
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Invalid assignment '{spec}'. Expected CHANNEL:ID:LAYOUT, e.g. 10:2:drums"
+        )
+
+
+def build_ensemble(
+    midi_file: str, assignments: list[tuple[int, int, str]], args: argparse.Namespace
+) -> tuple[list[MidiPlayer], list[str]]:
+    """Splits one MIDI file by channel in memory and builds one player per part."""
+    import mido
+
+    from split_midi import extract_channel, instrument_name
+
+    try:
+        mid = mido.MidiFile(midi_file)
+    except FileNotFoundError:
+        print(f"Error: File '{midi_file}' not found.")
+        return [], []
+
+    players: list[MidiPlayer] = []
+    labels: list[str] = []
+    for channel, instance_id, layout in assignments:
+        part, has_notes, program = extract_channel(mid, channel - 1)
+        name = instrument_name(channel - 1, program)
+        if not has_notes:
+            print(f"Channel {channel} ({name}) has no notes, skipping.")
+            continue
+
+        print(f"Channel {channel} ({name}) -> Instance {instance_id} ({layout})")
+        players.append(
+            MidiPlayer(
+                midi_file=f"{midi_file} [{name}]",
+                speed=args.speed,
+                transpose=args.transpose,
+                dry_run=args.dry_run,
+                layout=layout,
+                device_path=resolve_device_path(instance_id),
+                sink=open_x_sink(instance_id, args),
+                midi=part,
+                min_retrigger=args.min_retrigger / 1000,
+            )
+        )
+        labels.append(f"{instance_id}:{name}")
+    return players, labels
+
 
 if __name__ == "__main__":
+    startup.mark("modules imported")
     parser = argparse.ArgumentParser(description="Play MIDI files as game keystrokes.")
 
-    parser.add_argument("file", help="Path to the MIDI file")  # pyright: ignore[reportUnusedCallResult]
+    parser.add_argument("file", nargs="?", help="Path to the MIDI file")  # pyright: ignore[reportUnusedCallResult]
     parser.add_argument(
         "--device-path",
         type=str,
@@ -28,6 +176,18 @@ if __name__ == "__main__":
         default="keyboard",
         help="Control layout: 'keyboard' (default), 'guitar', or 'drums'",
     )
+    parser.add_argument(
+        "--timing",
+        choices=TIMING_MODES,
+        default="sleep",
+        help="Timing engine: 'sleep' (default, lowest CPU), 'hybrid' (sleep then spin) or 'spin' (busy-wait, most precise)",
+    )
+    parser.add_argument(
+        "--spin-threshold",
+        type=float,
+        default=2.0,
+        help="Hybrid mode: milliseconds before each deadline to stop sleeping and spin (default: 2.0). Higher is more precise but uses more CPU.",
+    )
 
     parser.add_argument(
         "--id",
@@ -35,44 +195,201 @@ if __name__ == "__main__":
         default=None,
         help="Target instance ID. If not specified AND no --device-path, uses standard input (global).",
     )
+    parser.add_argument(
+        "--part",
+        type=parse_part,
+        action="append",
+        metavar="ID:LAYOUT:FILE",
+        help="Play a part on an instance (repeatable). All parts run in one process on a shared clock, e.g. --part 1:keyboard:piano.mid --part 2:drums:drums.mid",
+    )
+    parser.add_argument(
+        "--ensemble",
+        type=parse_assignment,
+        action="append",
+        metavar="CHANNEL:ID:LAYOUT",
+        help="Ensemble mode (repeatable): split FILE by channel and play each assigned channel on an instance, all in sync, e.g. --ensemble 1:1:keyboard --ensemble 10:2:drums",
+    )
+    parser.add_argument(
+        "--min-retrigger",
+        type=float,
+        default=0.0,
+        metavar="MS",
+        help="Minimum time between two presses of the same key, in ms (default: 0 = off). Holds are shortened and too-fast repeats dropped so the game registers every press. The report of what changed prints only when the song is compiled, not on a cache hit (use --no-cache to see it again).",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Don't print a line per note (playback never waits on stdout)",
+    )
+    parser.add_argument(
+        "--log-file",
+        default=None,
+        help="Append the per-note log (with timestamps) to this file instead of stdout",
+    )
+    parser.add_argument(
+        "--latency-report",
+        action="store_true",
+        help="At the end, print press lateness percentiles, a histogram and the worst bars",
+    )
+    parser.add_argument(
+        "--latency-dump",
+        default=None,
+        metavar="FILE",
+        help="Write every press's scheduled/write/release time to FILE as CSV",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always recompile the MIDI instead of using the compiled tape cache",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Compiled tape cache directory (default: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--cache-evict",
+        type=float,
+        default=None,
+        metavar="DAYS",
+        help="Remove cached tapes not used in the last DAYS days (can be run without a file)",
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=None,
+        help="Keep only the N most recently used cached tapes (can be run without a file)",
+    )
+    parser.add_argument(
+        "--from",
+        dest="from_seconds",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Start this many seconds into the song (for rehearsing a section)",
+    )
+    parser.add_argument(
+        "--from-bar",
+        type=int,
+        default=None,
+        metavar="BAR",
+        help="Start at the beginning of this bar (1-based; with --part, the first part's bars)",
+    )
+    parser.add_argument(
+        "--start-at",
+        type=float,
+        default=None,
+        help="With --part/--ensemble: wall-clock UNIX time to start on instead of the 3s countdown",
+    )
+    parser.add_argument(
+        "--output",
+        choices=["uinput", "x"],
+        default="uinput",
+        help="'x' injects keys straight into the game window on X, skipping uinput and the input bridge (falls back to uinput if the window isn't found)",
+    )
+    parser.add_argument(
+        "--x-display",
+        default=None,
+        help="With --output x: X display of the game (default: $DISPLAY)",
+    )
+    parser.add_argument(
+        "--x-window",
+        default=None,
+        help="With --output x: window name (default: Heartopia_<ID>, as the launcher names it)",
+    )
+    parser.add_argument(
+        "--x-backend",
+        choices=["sendevent", "xtest"],
+        default="sendevent",
+        help="With --output x: XSendEvent to the window (default) or XTEST to the focused window",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="Print how long imports and each startup phase took (countdown excluded)",
+    )
 
     args = parser.parse_args()
+    startup.mark("arguments parsed")
+
+    tape_cache = None if args.no_cache else TapeCache(args.cache_dir)
+    if args.cache_evict is not None or args.cache_max_entries is not None:
+        removed = TapeCache(args.cache_dir).evict(
+            max_age_days=args.cache_evict, max_entries=args.cache_max_entries
+        )
+        print(f"Evicted {removed} cached tape(s) from {args.cache_dir}.")
+        if args.file is None and not args.part:
+            sys.exit(0)
+
+    players: list[MidiPlayer]
+    labels: list[str]
+    if args.ensemble:
+        if args.file is None:
+            parser.error("--ensemble needs a MIDI file")
+        players, labels = build_ensemble(args.file, args.ensemble, args)
+        if not players:
+            sys.exit(1)
+
+        engine = PlaybackEngine(
+            players,
+            labels=labels,
+            timing=args.timing,
+            spin_threshold=args.spin_threshold / 1000,
+            quiet=args.quiet,
+            log_file=args.log_file,
+            latency_report=args.latency_report,
+            latency_dump=args.latency_dump,
+        )
+        engine.start(
+            start_at=args.start_at, position=args.from_seconds, bar=args.from_bar
+        )
+        startup.report()
+        sys.exit(0)
+
+    if args.part:
+        # Multi-instance: one engine process drives every part's device
+        players = []
+        labels = []
+        for instance_id, layout, midi_file in args.part:
+            players.append(
+                MidiPlayer(
+                    midi_file=midi_file,
+                    speed=args.speed,
+                    transpose=args.transpose,
+                    dry_run=args.dry_run,
+                    layout=layout,
+                    device_path=resolve_device_path(instance_id),
+                    sink=open_x_sink(instance_id, args),
+                    tape_cache=tape_cache,
+                    min_retrigger=args.min_retrigger / 1000,
+                )
+            )
+            labels.append(f"{instance_id}:{layout}")
+
+        engine = PlaybackEngine(
+            players,
+            labels=labels,
+            timing=args.timing,
+            spin_threshold=args.spin_threshold / 1000,
+            quiet=args.quiet,
+            log_file=args.log_file,
+            latency_report=args.latency_report,
+            latency_dump=args.latency_dump,
+        )
+        engine.start(
+            start_at=args.start_at, position=args.from_seconds, bar=args.from_bar
+        )
+        startup.report()
+        sys.exit(0)
+
+    if args.file is None:
+        parser.error("a MIDI file is required unless --part is given")
 
     device_path = args.device_path
 
     # If device_path is NOT provided, check ID
     if device_path is None:
-        if args.id is not None:
-            # Try to read from .device_<ID> file
-            device_file = f".device_{args.id}"
-            try:
-                with open(device_file, "r") as f:
-                    content = f.read().strip()
-                    if os.path.exists(content):
-                        device_path = content
-                        print(
-                            f"Auto-detected device path for Instance {args.id}: {device_path}"
-                        )
-                    else:
-                        print(
-                            f"Warning: Stale device file found. Path '{content}' does not exist."
-                        )
-                        print(f"Is Instance {args.id} running?")
-                        # We could fallback to None (Global) or exit.
-                        # If the user specifically asked for ID 1, failing is probably better than guessing?
-                        # But existing behavior for "file not found" was "pass" (uses global).
-                        # Let's stick to "pass" but with the warning.
-            except FileNotFoundError:
-                print(
-                    f"Warning: Could not find '{device_file}'. Using standard global input."
-                )
-                pass
-        else:
-            # No ID and No Device Path -> Standard Input (Global UInput)
-            print(
-                "No instance ID or device path specified. Using standard global input."
-            )
-            pass
+        device_path = resolve_device_path(args.id)
 
     player = MidiPlayer(
         midi_file=args.file,
@@ -81,6 +398,17 @@ if __name__ == "__main__":
         dry_run=args.dry_run,
         layout=args.layout,
         device_path=device_path,
+        sink=open_x_sink(args.id, args),
+        timing=args.timing,
+        spin_threshold=args.spin_threshold / 1000,
+        tape_cache=tape_cache,
+        min_retrigger=args.min_retrigger / 1000,
+        quiet=args.quiet,
+        log_file=args.log_file,
+        latency_report=args.latency_report,
+        latency_dump=args.latency_dump,
     )
 
-    player.start()
+    startup.mark("device opened")
+    player.start(position=args.from_seconds, bar=args.from_bar)
+    startup.report()
@@ -0,0 +1,162 @@
+import bisect
+from array import array
+from typing import TYPE_CHECKING
+
+from drum_keys import assign_keys
+from mappings import get_key_name, key_table, table_index
+
+# Action values double as evdev EV_KEY values (0 = release, 1 = press)
+ACTION_RELEASE = 0
+ACTION_PRESS = 1
+
+DEFAULT_TEMPO = 500000  # microseconds per beat (120 BPM)
+
+if TYPE_CHECKING:
+    import mido
+
+
+class Schedule:
+    """
+    Flat, array-backed list of key transitions sorted by deadline.
+
+    Entry i is the tuple (times[i], codes[i], actions[i]), where times are
+    seconds relative to the start of playback (speed already applied).
+    notes[i] keeps the transposed MIDI note that produced the entry, for logging,
+    and beats[i] its musical position in quarter-note beats from the start.
+    """
+
+    def __init__(self) -> None:
+        self.times: array[float] = array("d")
+        self.codes: array[int] = array("H")
+        self.actions: array[int] = array("B")
+        self.notes: array[int] = array("h")
+        self.beats: array[float] = array("d")
+        self.beats_per_bar = 4.0
+        # Backing storage (e.g. an mmap) when the arrays are views loaded from the tape cache
+        self.buffer: object | None = None
+        # (beats, times) of the presses only, built on first use by time_at_beat
+        self._press_index: tuple[array[float], array[float]] | None = None
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def append(
+        self, t: float, key_code: int, action: int, note: int, beat: float = 0.0
+    ) -> None:
+        self.times.append(t)
+        self.codes.append(key_code)
+        self.actions.append(action)
+        self.notes.append(note)
+        self.beats.append(beat)
+
+    def sort(self) -> None:
+        """Sorts entries by deadline; releases go before presses at the same instant."""
+        order = sorted(
+            range(len(self.times)), key=lambda i: (self.times[i], self.actions[i])
+        )
+        self.times = array("d", (self.times[i] for i in order))
+        self.codes = array("H", (self.codes[i] for i in order))
+        self.actions = array("B", (self.actions[i] for i in order))
+        self.notes = array("h", (self.notes[i] for i in order))
+        self.beats = array("d", (self.beats[i] for i in order))
+        self._press_index = None
+
+    def bar_beat(self, i: int) -> tuple[int, float]:
+        """1-based (bar, beat within bar) of entry i."""
+        bar, beat = divmod(self.beats[i], self.beats_per_bar)
+        return int(bar) + 1, beat + 1
+
+    def time_at_beat(self, beat: float) -> float:
+        """
+        Deadline of the first press at or after beat (the song's end if none).
+
+        Presses are in both time and beat order, unlike the whole schedule
+        (a release keeps its press's beat), so this bisects a press-only index.
+        """
+        if self._press_index is None:
+            beats: array[float] = array("d")
+            times: array[float] = array("d")
+            for i in range(len(self.times)):
+                if self.actions[i] == ACTION_PRESS:
+                    beats.append(self.beats[i])
+                    times.append(self.times[i])
+            self._press_index = (beats, times)
+
+        beats, times = self._press_index
+        n = bisect.bisect_left(beats, beat)
+        return times[n] if n < len(times) else self.duration
+
+    @property
+    def duration(self) -> float:
+        return self.times[-1] if self.times else 0.0
+
+    def dump(self) -> None:
+        """Prints the schedule as a table (used by --dry-run)."""
+        print(f"Compiled schedule: {len(self)} events, {self.duration:.3f}s")
+        for i in range(len(self)):
+            action = "press" if self.actions[i] == ACTION_PRESS else "release"
+            bar, beat = self.bar_beat(i)
+            print(
+                f"{self.times[i]:10.4f}s  bar {bar:4d} beat {beat:5.2f}  {action:<7}  "
+                f"note {self.notes[i]:4d}  key '{get_key_name(self.codes[i])}'"
+            )
+
+
+def compile_schedule(
+    mid: "mido.MidiFile",
+    layout: str = "keyboard",
+    transpose: int = 0,
+    speed: float = 1.0,
+    press_duration: float = 0.1,
+) -> Schedule:
+    """
+    Compiles a MIDI file into a Schedule of absolute press/release deadlines.
+
+    Every mapped note_on becomes a press at its (speed-scaled) absolute time
+    and a release press_duration seconds later, matching the fire-and-forget
+    taps the player has always sent. note_off messages are ignored.
+    """
+    import mido
+
+    keys_by_note = key_table(layout).keys
+    schedule = Schedule()
+    # (deadline, note, beat, candidate keys) of every mapped note_on
+    hits: list[tuple[float, int, float, tuple[int, ...]]] = []
+
+    tempo = DEFAULT_TEMPO
+    now = 0.0
+    ticks = 0
+    time_signature_seen = False
+    for msg in mido.merge_tracks(mid.tracks):
+        if msg.time > 0:
+            now += mido.tick2second(msg.time, mid.ticks_per_beat, tempo)
+            ticks += msg.time
+
+        if msg.type == "set_tempo" and isinstance(msg, mido.MetaMessage):
+            tempo = msg.tempo
+            continue
+
+        # Bar positions use the first time signature only
+        if msg.type == "time_signature" and isinstance(msg, mido.MetaMessage):
+            if not time_signature_seen:
+                schedule.beats_per_bar = msg.numerator * 4 / msg.denominator
+                time_signature_seen = True
+            continue
+
+        if msg.type != "note_on" or msg.velocity == 0:
+            continue
+
+        note = msg.note + transpose
+        keys = keys_by_note[table_index(note)]
+        if not keys:
+            continue
+        hits.append((now / speed, note, ticks / mid.ticks_per_beat, keys))
+
+    # Drum notes mapped to several keys get one picked with the whole part in view
+    key_codes = assign_keys([hit[0] for hit in hits], [hit[3] for hit in hits])
+    for (deadline, note, beat, _), key_code in zip(hits, key_codes):
+        schedule.append(deadline, key_code, ACTION_PRESS, note, beat)
+        schedule.append(deadline + press_duration, key_code, ACTION_RELEASE, note, beat)
+
+    schedule.sort()
+    return schedule
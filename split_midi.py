@@ -136,6 +136,84 @@ GM_INSTRUMENTS = {
 }
 
 
+def used_channels(mid: mido.MidiFile) -> set[int]:
+    """Returns all unique (0-indexed) channels used in the MIDI file."""
+    channels = set()
+    for track in mid.tracks:
+        for msg in track:
+            if not msg.is_meta and hasattr(msg, "channel"):
+                channels.add(msg.channel)
+    return channels
+
+
+def extract_channel(
+    mid: mido.MidiFile, channel: int
+) -> tuple[mido.MidiFile, bool, int | None]:
+    """
+    Builds an in-memory MidiFile with only the messages of one channel.
+
+    Meta and channel-less messages are kept so tempo and timing survive.
+    Returns (new_mid, has_notes, program_found).
+    """
+    new_mid = mido.MidiFile(ticks_per_beat=mid.ticks_per_beat)
+
+    has_notes = False
+    program_found = None
+
+    for track in mid.tracks:
+        new_track = mido.MidiTrack()
+        accumulated_time = 0
+
+        for msg in track:
+            dt = msg.time
+
+            # Keep meta messages
+            if msg.is_meta:
+                new_msg = msg.copy()
+                new_msg.time += accumulated_time
+                new_track.append(new_msg)
+                accumulated_time = 0
+
+            # Keep messages for the current channel
+            elif hasattr(msg, "channel") and msg.channel == channel:
+                new_msg = msg.copy()
+                new_msg.time += accumulated_time
+                new_track.append(new_msg)
+                accumulated_time = 0
+                if msg.type == "note_on" or msg.type == "note_off":
+                    has_notes = True
+                if msg.type == "program_change":
+                    program_found = msg.program
+            # Keep messages without channel attribute (rare, but possible like sysex if not meta)
+            elif not hasattr(msg, "channel"):
+                # Usually sysex are treated as distinct by mido, let's include them?
+                # Sysex usually global.
+                new_msg = msg.copy()
+                new_msg.time += accumulated_time
+                new_track.append(new_msg)
+                accumulated_time = 0
+            else:
+                # Skip other channels, accumulate time
+                accumulated_time += dt
+
+        # Only add track if it has meaningful content?
+        # Actually, standard practice is to keep track 0 for meta even if empty of notes.
+        # But let's add it regardless if it's not empty.
+        if len(new_track) > 0:
+            new_mid.tracks.append(new_track)
+
+    return new_mid, has_notes, program_found
+
+
+def instrument_name(channel: int, program: int | None) -> str:
+    """Human-readable name for a channel, using the General MIDI program list."""
+    if channel == 9:  # MIDI channel 10 is typically drums (0-indexed)
+        return "Drums"
+    if program is not None:
+        return GM_INSTRUMENTS.get(program, f"Program_{program}")
+    return f"Channel_{channel + 1}"
+
+
 def split_midi_by_channel(file_path):
     try:
         mid = mido.MidiFile(file_path)
@@ -145,99 +223,39 @@ def split_midi_by_channel(file_path):
 
     print(f"Analyzing {file_path} for channels...")
 
-    # Find all unique channels used in the MIDI file
-    used_channels = set()
-    for track in mid.tracks:
-        for msg in track:
-            if not msg.is_meta and hasattr(msg, "channel"):
-                used_channels.add(msg.channel)
-
-    if not used_channels:
+    channels = used_channels(mid)
+    if not channels:
         print("No channels found in MIDI file.")
         return
 
-    print(f"Found channels: {sorted(list(used_channels))}")
+    print(f"Found channels: {sorted(list(channels))}")
 
     # Create output directory
     base_name = os.path.splitext(os.path.basename(file_path))[0]
     output_dir = os.path.join(os.path.dirname(file_path), f"{base_name}_split")
     os.makedirs(output_dir, exist_ok=True)
 
-    for channel in used_channels:
-        new_mid = mido.MidiFile(ticks_per_beat=mid.ticks_per_beat)
-
-        has_notes = False
-        program_found = None
-
-        for track in mid.tracks:
-            new_track = mido.MidiTrack()
-            accumulated_time = 0
-
-            for msg in track:
-                dt = msg.time
-
-                # Keep meta messages
-                if msg.is_meta:
-                    new_msg = msg.copy()
-                    new_msg.time += accumulated_time
-                    new_track.append(new_msg)
-                    accumulated_time = 0
-
-                # Keep messages for the current channel
-                elif hasattr(msg, "channel") and msg.channel == channel:
-                    new_msg = msg.copy()
-                    new_msg.time += accumulated_time
-                    new_track.append(new_msg)
-                    accumulated_time = 0
-                    if msg.type == "note_on" or msg.type == "note_off":
-                        has_notes = True
-                    if msg.type == "program_change":
-                        program_found = msg.program
-                # Keep messages without channel attribute (rare, but possible like sysex if not meta)
-                elif not hasattr(msg, "channel"):
-                    # Usually sysex are treated as distinct by mido, let's include them?
-                    # Sysex usually global.
-                    new_msg = msg.copy()
-                    new_msg.time += accumulated_time
-                    new_track.append(new_msg)
-                    accumulated_time = 0
-                else:
-                    # Skip other channels, accumulate time
-                    accumulated_time += dt
-
-            # Only add track if it has meaningful content?
-            # Actually, standard practice is to keep track 0 for meta even if empty of notes.
-            # But let's add it regardless if it's not empty.
-            if len(new_track) > 0:
-                new_mid.tracks.append(new_track)
+    for channel in channels:
+        new_mid, has_notes, program_found = extract_channel(mid, channel)
 
         # Save file
         if has_notes:
-            instrument_name = f"Channel_{channel + 1}"
-
-            if channel == 9:  # MIDI channel 10 is typically drums (0-indexed)
-                instrument_name = "Drums"
-            elif program_found is not None:
-                instrument_name = GM_INSTRUMENTS.get(
-                    program_found, f"Program_{program_found}"
-                )
-                # Clean up filename (remove spaces, etc if needed, or keep spaces)
-                instrument_name = (
-                    instrument_name.replace(" ", "_")
-                    .replace("/", "-")
-                    .replace("(", "")
-                    .replace(")", "")
-                )
-
-            out_filename = os.path.join(
-                output_dir, f"{base_name}_{instrument_name}.mid"
+            # Clean up filename (remove spaces, etc if needed, or keep spaces)
+            name = (
+                instrument_name(channel, program_found)
+                .replace(" ", "_")
+                .replace("/", "-")
+                .replace("(", "")
+                .replace(")", "")
             )
 
+            out_filename = os.path.join(output_dir, f"{base_name}_{name}.mid")
+
             # Handle duplicates if multiple channels use same instrument
             counter = 1
             while os.path.exists(out_filename):
                 out_filename = os.path.join(
-                    output_dir, f"{base_name}_{instrument_name}_{counter}.mid"
+                    output_dir, f"{base_name}_{name}_{counter}.mid"
                 )
                 counter += 1
 
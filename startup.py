@@ -0,0 +1,98 @@
+"""
+--startup-profile support: times every module imported after enable() and
+the startup phases marked along the way, then prints the breakdown.
+
+Every function is a no-op unless enable() was called, so callers can mark
+phases unconditionally.
+"""
+
+import builtins
+import sys
+import time
+
+# Imports faster than this are left out of the report
+MIN_REPORTED_IMPORT = 0.0005
+
+
+class StartupProfile:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        # (depth, module, inclusive seconds, self seconds), in import order
+        self.imports: list[tuple[int, str, float, float]] = []
+        self.phases: list[tuple[str, float]] = []
+        # Time spent on purpose (the countdown), left out of the phases
+        self.excluded = 0.0
+        self._children: list[float] = []
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+
+        slot = len(self.imports)
+        depth = len(self._children)
+        self.imports.append((depth, name, 0.0, 0.0))
+        self._children.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            self.imports[slot] = (depth, name, elapsed, elapsed - children)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start - self.excluded
+
+    def report(self) -> None:
+        builtins.__import__ = self._import
+        out = sys.stderr
+        print("Startup profile (ms, countdown excluded):", file=out)
+        previous = 0.0
+        for phase, at in self.phases:
+            print(
+                f"  {at * 1000:8.1f}  (+{(at - previous) * 1000:6.1f})  {phase}",
+                file=out,
+            )
+            previous = at
+
+        total = sum(inclusive for depth, _, inclusive, _ in self.imports if depth == 0)
+        print(f"Imports: {total * 1000:.1f} ms (inclusive / self):", file=out)
+        for depth, name, inclusive, own in self.imports:
+            if inclusive < MIN_REPORTED_IMPORT:
+                continue
+            print(
+                f"  {inclusive * 1000:7.1f} {own * 1000:7.1f}  {'  ' * depth}{name}",
+                file=out,
+            )
+
+
+_profile: StartupProfile | None = None
+
+
+def enable() -> None:
+    global _profile
+    if _profile is None:
+        _profile = StartupProfile()
+
+
+def mark(phase: str) -> None:
+    """Records that startup reached phase."""
+    if _profile is not None:
+        _profile.phases.append((phase, _profile.elapsed()))
+
+
+def exclude(seconds: float) -> None:
+    if _profile is not None:
+        _profile.excluded += seconds
+
+
+def report() -> None:
+    """Prints the breakdown (once)."""
+    global _profile
+    if _profile is not None:
+        _profile.report()
+        _profile = None
@@ -0,0 +1,177 @@
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+from mappings import MAPPING_VERSION
+from schedule import Schedule
+
+# Bump when the on-disk layout below changes
+TAPE_FORMAT_VERSION = 2
+TAPE_MAGIC = b"HMTP"
+
+# magic, format version, entry count, final transpose, padding (keeps the
+# doubles 8-byte aligned), beats per bar
+HEADER = struct.Struct("<4sHIi2xd")
+
+# Bytes per entry: times (f64), beats (f64), codes (u16), notes (i16), actions (u8)
+ENTRY_SIZE = 8 + 8 + 2 + 2 + 1
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "hertopia-musica",
+    "tapes",
+)
+
+
+def tape_key(
+    midi_file: str,
+    layout: str,
+    transpose: int,
+    speed: float,
+    press_duration: float,
+    min_retrigger: float = 0.0,
+) -> str:
+    """Hash of the file content plus every setting that changes the compiled tape."""
+    h = hashlib.sha256()
+    with open(midi_file, "rb") as f:
+        h.update(f.read())
+    h.update(
+        f"|{layout}|{transpose}|{float(speed)!r}|{float(press_duration)!r}"
+        f"|{float(min_retrigger)!r}|{MAPPING_VERSION}|{TAPE_FORMAT_VERSION}".encode()
+    )
+    return h.hexdigest()
+
+
+class TapeCache:
+    """
+    Directory of compiled schedules ("tapes"), one binary file per key.
+
+    A tape is a fixed header followed by the raw times (f64), beats (f64),
+    codes (u16), notes (i16) and actions (u8) arrays. Loading memory-maps the file and
+    casts views over it, so a cache hit never touches mido.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.tape")
+
+    def load(self, key: str) -> tuple[Schedule, int] | None:
+        """Returns (schedule, final transpose) for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # ValueError: empty file cannot be mapped
+            return None
+
+        valid = False
+        try:
+            try:
+                header = HEADER.unpack_from(buf, 0)
+            except struct.error:
+                return None
+            magic, version, count, transpose, beats_per_bar = header
+            if magic != TAPE_MAGIC or version != TAPE_FORMAT_VERSION:
+                return None
+            if len(buf) != HEADER.size + count * ENTRY_SIZE:
+                print(f"Warning: Ignoring truncated tape {path}")
+                return None
+            valid = True
+        finally:
+            if not valid:
+                buf.close()
+
+        view = memoryview(buf)
+        offset = HEADER.size
+        schedule = Schedule()
+        schedule.times = view[offset : offset + count * 8].cast("d")  # type: ignore
+        offset += count * 8
+        schedule.beats = view[offset : offset + count * 8].cast("d")  # type: ignore
+        offset += count * 8
+        schedule.codes = view[offset : offset + count * 2].cast("H")  # type: ignore
+        offset += count * 2
+        schedule.notes = view[offset : offset + count * 2].cast("h")  # type: ignore
+        offset += count * 2
+        schedule.actions = view[offset : offset + count].cast("B")  # type: ignore
+        schedule.beats_per_bar = beats_per_bar
+        # Keep the mapping alive as long as the schedule references it
+        schedule.buffer = buf
+
+        # Touch for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return schedule, transpose
+
+    def store(self, key: str, schedule: Schedule, transpose: int) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(
+                    HEADER.pack(
+                        TAPE_MAGIC,
+                        TAPE_FORMAT_VERSION,
+                        len(schedule),
+                        transpose,
+                        schedule.beats_per_bar,
+                    )
+                )
+                f.write(schedule.times.tobytes())
+                f.write(schedule.beats.tobytes())
+                f.write(schedule.codes.tobytes())
+                f.write(schedule.notes.tobytes())
+                f.write(schedule.actions.tobytes())
+            # Atomic so a concurrent reader never maps a half-written tape
+            os.replace(tmp_path, path)
+        except OSError as ex:
+            print(f"Warning: Could not write tape cache: {ex}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def evict(
+        self, max_age_days: float | None = None, max_entries: int | None = None
+    ) -> int:
+        """
+        Removes tapes not used for max_age_days and/or all but the
+        max_entries most recently used ones. Returns how many were removed.
+        """
+        try:
+            names = [n for n in os.listdir(self.cache_dir) if n.endswith(".tape")]
+        except FileNotFoundError:
+            return 0
+
+        entries: list[tuple[float, str]] = []
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort(reverse=True)  # Most recently used first
+
+        doomed: list[str] = []
+        if max_entries is not None:
+            doomed.extend(path for _, path in entries[max_entries:])
+            entries = entries[:max_entries]
+        if max_age_days is not None:
+            cutoff = time.time() - max_age_days * 86400
+            doomed.extend(path for mtime, path in entries if mtime < cutoff)
+
+        removed = 0
+        for path in doomed:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
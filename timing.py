@@ -0,0 +1,134 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+
+TIMING_MODES = ("sleep", "hybrid", "spin")
+
+# Events later than this count as "late" in the summary
+LATE_THRESHOLD = 0.001
+
+
+class TimingStats:
+    """Per-event lateness (seconds past the deadline) recorded by a Timer."""
+
+    def __init__(self) -> None:
+        self.lateness: array[float] = array("d")
+        self.late_count = 0
+        self.max_lateness = 0.0
+
+    def record(self, lateness: float) -> None:
+        self.lateness.append(lateness)
+        if lateness > LATE_THRESHOLD:
+            self.late_count += 1
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+
+    def summary(self) -> str:
+        count = len(self.lateness)
+        if count == 0:
+            return "Timing: no events."
+        mean = sum(self.lateness) / count
+        return (
+            f"Timing: {count} events, mean lateness {mean * 1000:.3f} ms, "
+            f"max {self.max_lateness * 1000:.3f} ms, "
+            f"{self.late_count} later than {LATE_THRESHOLD * 1000:.0f} ms"
+        )
+
+
+class Timer(ABC):
+    """
+    Waits until absolute deadlines on the time.perf_counter clock.
+
+    Subclasses set name and implement _wait; wait_until records how late
+    each event was.
+    """
+
+    name: str
+
+    def __init__(self) -> None:
+        self.stats = TimingStats()
+
+    def wait_until(self, deadline: float, wake: threading.Event | None = None) -> float:
+        """
+        Blocks until deadline and returns how late we woke up (seconds).
+
+        If wake is set before the deadline, returns early with a negative
+        lateness that is not recorded (pause, seek and speed changes).
+        """
+        self._wait(deadline, wake)
+        lateness = time.perf_counter() - deadline
+        if lateness < 0 and wake is not None and wake.is_set():
+            return lateness
+        self.stats.record(lateness)
+        return lateness
+
+    @abstractmethod
+    def _wait(self, deadline: float, wake: threading.Event | None) -> None: ...
+
+
+def _sleep(seconds: float, wake: threading.Event | None) -> None:
+    if wake is None:
+        time.sleep(seconds)
+    else:
+        wake.wait(seconds)
+
+
+class SleepTimer(Timer):
+    """Plain time.sleep. Cheapest on CPU, overshoots by the OS wakeup latency."""
+
+    name = "sleep"
+
+    def _wait(self, deadline: float, wake: threading.Event | None) -> None:
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            _sleep(remaining, wake)
+
+
+class HybridTimer(Timer):
+    """
+    Coarse sleep until spin_threshold before the deadline, then busy-wait.
+
+    A larger spin_threshold absorbs worse wakeup latency at the cost of more
+    CPU per event; 0 degrades to SleepTimer.
+    """
+
+    name = "hybrid"
+
+    def __init__(self, spin_threshold: float = 0.002) -> None:
+        super().__init__()
+        self.spin_threshold = spin_threshold
+
+    def _wait(self, deadline: float, wake: threading.Event | None) -> None:
+        remaining = deadline - time.perf_counter() - self.spin_threshold
+        if remaining > 0:
+            _sleep(remaining, wake)
+        _spin(deadline, wake)
+
+
+class SpinTimer(Timer):
+    """Pure busy-wait. Most precise, burns a full core for the whole song."""
+
+    name = "spin"
+
+    def _wait(self, deadline: float, wake: threading.Event | None) -> None:
+        _spin(deadline, wake)
+
+
+def _spin(deadline: float, wake: threading.Event | None) -> None:
+    if wake is None:
+        while time.perf_counter() < deadline:
+            pass
+    else:
+        while time.perf_counter() < deadline and not wake.is_set():
+            pass
+
+
+def make_timer(mode: str = "sleep", spin_threshold: float = 0.002) -> Timer:
+    if mode == "hybrid":
+        return HybridTimer(spin_threshold)
+    if mode == "spin":
+        return SpinTimer()
+    if mode == "sleep":
+        return SleepTimer()
+    raise ValueError(f"Unknown timing mode '{mode}'. Choose from {TIMING_MODES}.")
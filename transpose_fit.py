@@ -0,0 +1,90 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from mappings import LAYOUT_RANGES, TABLE_OFFSET, key_table
+
+if TYPE_CHECKING:
+    import mido
+
+# Pitch classes of the white keys (C major / A minor)
+WHITE_KEYS = np.zeros(12, dtype=bool)
+WHITE_KEYS[[0, 2, 4, 5, 7, 9, 11]] = True
+
+DEFAULT_SHIFTS = np.arange(-36, 36)
+
+
+def pitch_histogram(mid: "mido.MidiFile") -> np.ndarray:
+    """Counts of every sounding note (note_on with velocity > 0), indexed by note."""
+    notes = [
+        msg.note
+        for track in mid.tracks
+        for msg in track
+        if msg.type == "note_on" and msg.velocity > 0
+    ]
+    return np.bincount(np.asarray(notes, dtype=np.intp), minlength=128)[:128]
+
+
+class TransposeFit:
+    """
+    Per-shift scores of a pitch histogram against one layout.
+
+    Every array is indexed like shifts:
+      playable   - notes that map to a key after folding
+      white      - notes landing on a white-key pitch class
+      in_window  - notes already inside the layout's range (no folding needed)
+      collisions - notes folded onto the same note as a different source pitch
+      lost       - notes the layout can't play at all
+    """
+
+    def __init__(
+        self, hist: np.ndarray, layout: str, shifts: np.ndarray = DEFAULT_SHIFTS
+    ):
+        self.layout = layout
+        self.shifts = np.asarray(shifts)
+        self.total = int(hist.sum())
+
+        table = key_table(layout)
+        folded_table = np.frombuffer(table.folded, dtype=np.int16)
+
+        present = np.flatnonzero(hist)
+        counts = hist[present]
+        # (shift, source note) -> transposed note, then one lookup for folding
+        shifted = present[None, :] + self.shifts[:, None]
+        folded = folded_table[shifted + TABLE_OFFSET]
+        mapped = folded >= 0
+
+        self.playable = (mapped * counts).sum(axis=1)
+        self.lost = self.total - self.playable
+        self.white = (WHITE_KEYS[shifted % 12] * counts).sum(axis=1)
+
+        window = LAYOUT_RANGES.get(layout)
+        if window is None:
+            self.in_window = self.playable
+        else:
+            inside = (shifted >= window[0]) & (shifted <= window[1])
+            self.in_window = (inside * counts).sum(axis=1)
+
+        # Distinct source pitches per (shift, folded note); > 1 means a collision
+        rows = np.broadcast_to(np.arange(len(self.shifts))[:, None], folded.shape)
+        sources = np.zeros((len(self.shifts), 128), dtype=np.int32)
+        np.add.at(sources, (rows[mapped], folded[mapped]), 1)
+        shared = np.zeros(folded.shape, dtype=bool)
+        shared[mapped] = sources[rows[mapped], folded[mapped]] > 1
+        self.collisions = (shared * counts).sum(axis=1)
+
+    def ranking(self) -> np.ndarray:
+        """
+        Shift indices, best first: most playable notes, then most notes
+        inside the range unfolded, then fewest collisions, then smallest shift.
+        """
+        return np.lexsort(
+            (np.abs(self.shifts), self.collisions, -self.in_window, -self.playable)
+        )
+
+    def best(self) -> int:
+        return int(self.shifts[self.ranking()[0]])
+
+    def at(self, shift: int) -> int:
+        """Index of shift in the score arrays."""
+        return int(np.flatnonzero(self.shifts == shift)[0])
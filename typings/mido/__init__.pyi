@@ -1,5 +1,7 @@
 from typing import IO, Any, Iterator, List, Optional, Union
 
+from . import ports
+
 class Message:
     type: str
     time: float
@@ -10,9 +12,13 @@ class Message:
     def copy(self, **kwargs: Any) -> "Message": ...
 
 def format_as_string(msg: Message, include_time: bool = True) -> str: ...
+def tick2second(tick: float, ticks_per_beat: int, tempo: int) -> float: ...
 
 class MetaMessage(Message):
     is_meta: bool
+    tempo: int
+    numerator: int
+    denominator: int
 
 class MidiTrack(List[Union[Message, MetaMessage]]):
     def __init__(self) -> None: ...
@@ -34,3 +40,7 @@ class MidiFile:
     ) -> Iterator[Union[Message, MetaMessage]]: ...
     @property
     def length(self) -> float: ...
+
+def merge_tracks(tracks: List[MidiTrack], skip_checks: bool = False) -> MidiTrack: ...
+def get_input_names(**kwargs: Any) -> List[str]: ...
+def open_input(name: Optional[str] = None, **kwargs: Any) -> ports.BaseInput: ...
@@ -0,0 +1,11 @@
+from typing import Iterator, Optional
+
+from . import Message
+
+class BaseInput:
+    name: Optional[str]
+    closed: bool
+    def __iter__(self) -> Iterator[Message]: ...
+    def __enter__(self) -> "BaseInput": ...
+    def __exit__(self, *args: object) -> None: ...
+    def close(self) -> None: ...
@@ -0,0 +1,230 @@
+"""
+Keeps track of the game window on an X display without polling.
+
+The window tree is walked once at startup. After that every window we know
+about has SubstructureNotify and PropertyChange selected, so creations,
+destructions, reparents and renames arrive as events and the cached tree is
+updated incrementally. The target is re-resolved from that cache, which
+costs no X round trips.
+"""
+
+from collections.abc import Callable
+
+from Xlib import X, Xatom, error
+from Xlib.display import Display
+from Xlib.xobject.drawable import Window
+
+WATCH_MASK = X.SubstructureNotifyMask | X.PropertyChangeMask
+
+# Name of the game window inside a Wine virtual desktop
+INNER_GAME_NAMES = ("Heartopia", "Heartopia_1")
+
+
+def is_container_name(name: str | None, target_name: str) -> bool:
+    """Top-level match: the game itself or its Wine virtual desktop."""
+    return bool(
+        name
+        and (
+            name == target_name
+            or name == f"{target_name} - Wine Desktop"
+            or f"{target_name} -" in name
+        )
+    )
+
+
+class WindowTracker:
+    """
+    Cached handle to the window keys should be sent to.
+
+    window is None while the game has no window (not started yet, or being
+    recreated); callers drop their events until it is back. on_change gets
+    the new window and its name every time the target changes. Call
+    process_events() whenever the display connection is readable and after
+    each batch of requests, since Xlib may have queued events while waiting
+    for a reply.
+    """
+
+    def __init__(
+        self,
+        d: Display,
+        target_name: str,
+        on_change: Callable[[Window | None, str | None], None] | None = None,
+    ):
+        self.display = d
+        self.target_name = target_name
+        self.on_change = on_change
+        self.root = d.screen().root
+        self.window: Window | None = None
+        self.container: Window | None = None
+        # Asynchronous X errors (not counting watched windows that vanished)
+        self.errors = 0
+
+        self._names: dict[int, str | None] = {}
+        self._parents: dict[int, int] = {}
+        self._children: dict[int, list[int]] = {}
+        self._name_atoms = (Xatom.WM_NAME, d.intern_atom("_NET_WM_NAME"))
+
+        # Asynchronous errors (send_event has no reply) would otherwise only
+        # be printed by Xlib; a BadWindow on the target means it is gone
+        d.set_error_handler(self._on_error)
+
+        self._scan(self.root.id, 0)
+        self.display.flush()
+        self._resolve()
+
+    def _watch(self, window_id: int) -> Window:
+        window = self.display.create_resource_object("window", window_id)
+        # Selected before reading the children/name, so nothing created or
+        # renamed in between is missed
+        window.change_attributes(event_mask=WATCH_MASK)
+        return window
+
+    def _scan(self, window_id: int, parent_id: int) -> None:
+        """Adds a window and its subtree (one query_tree per window)."""
+        window = self._add(window_id, parent_id)
+        if window is None:
+            return
+        try:
+            children = window.query_tree().children
+        except error.XError:
+            return
+        for child in children:
+            self._scan(child.id, window_id)
+
+    def _add(self, window_id: int, parent_id: int) -> Window | None:
+        self._remove(window_id)
+        try:
+            window = self._watch(window_id)
+            name = window.get_wm_name() if window_id != self.root.id else None
+        except error.XError:
+            # Destroyed before we got to it
+            return None
+        self._names[window_id] = name
+        self._parents[window_id] = parent_id
+        self._children.setdefault(window_id, [])
+        if parent_id:
+            self._children.setdefault(parent_id, []).append(window_id)
+        return window
+
+    def _remove(self, window_id: int) -> None:
+        if window_id not in self._names:
+            return
+        for child in self._children.pop(window_id, []):
+            self._remove(child)
+        del self._names[window_id]
+        parent = self._parents.pop(window_id)
+        siblings = self._children.get(parent)
+        if siblings and window_id in siblings:
+            siblings.remove(window_id)
+
+    def _reparent(self, window_id: int, parent_id: int) -> None:
+        old = self._parents.get(window_id)
+        if old is None:
+            self._scan(window_id, parent_id)
+            return
+        if old in self._children and window_id in self._children[old]:
+            self._children[old].remove(window_id)
+        self._parents[window_id] = parent_id
+        self._children.setdefault(parent_id, []).append(window_id)
+
+    def _rename(self, window_id: int) -> None:
+        try:
+            window = self.display.create_resource_object("window", window_id)
+            self._names[window_id] = window.get_wm_name()
+        except error.XError:
+            self._remove(window_id)
+
+    def _find(
+        self,
+        start: int,
+        match: Callable[[str | None], bool],
+        siblings_first: bool = False,
+    ) -> int | None:
+        """
+        Searches the cached tree below start (no X requests). With
+        siblings_first every child is checked before descending into any of
+        them, as the container lookup always did; otherwise depth-first, as
+        the inner game window lookup did.
+        """
+        children = self._children.get(start, ())
+        if siblings_first:
+            for child in children:
+                if match(self._names.get(child)):
+                    return child
+        for child in children:
+            if not siblings_first and match(self._names.get(child)):
+                return child
+            found = self._find(child, match, siblings_first)
+            if found is not None:
+                return found
+        return None
+
+    def _resolve(self) -> None:
+        container = self._find(
+            self.root.id,
+            lambda name: is_container_name(name, self.target_name),
+            siblings_first=True,
+        )
+        target = None
+        if container is not None:
+            name = self._names[container]
+            if name and "Wine Desktop" in name:
+                target = self._find(container, lambda n: n in INNER_GAME_NAMES)
+            else:
+                target = container
+
+        self.container = (
+            self.display.create_resource_object("window", container)
+            if container is not None
+            else None
+        )
+        old = self.window
+        if (old.id if old else None) == target:
+            return
+        self.window = (
+            self.display.create_resource_object("window", target)
+            if target is not None
+            else None
+        )
+        if self.on_change is not None:
+            name = self._names.get(target) if target is not None else None
+            self.on_change(self.window, name)
+
+    def _on_error(self, err: error.XError, request) -> None:
+        if not isinstance(err, error.BadWindow):
+            self.errors += 1
+        elif self.window is not None and err.resource_id == self.window.id:
+            # The DestroyNotify will follow; stop sending to it right away
+            self.errors += 1
+            self._remove(self.window.id)
+            self._resolve()
+        # Other BadWindows are watched windows that vanished, nothing to do
+
+    def process_events(self) -> None:
+        """Applies every queued X event to the cached tree."""
+        d = self.display
+        changed = False
+        while d.pending_events():
+            ev = d.next_event()
+            if ev.type == X.CreateNotify:
+                if ev.parent.id in self._names:
+                    # Children created before our event mask was selected on
+                    # the new window would send no CreateNotify of their own
+                    self._scan(ev.window.id, ev.parent.id)
+                    changed = True
+            elif ev.type == X.DestroyNotify:
+                if ev.window.id in self._names:
+                    self._remove(ev.window.id)
+                    changed = True
+            elif ev.type == X.ReparentNotify:
+                if ev.parent.id in self._names:
+                    self._reparent(ev.window.id, ev.parent.id)
+                else:
+                    self._remove(ev.window.id)
+                changed = True
+            elif ev.type == X.PropertyNotify:
+                if ev.atom in self._name_atoms and ev.window.id in self._names:
+                    self._rename(ev.window.id)
+                    changed = True
+        if changed:
+            self._resolve()
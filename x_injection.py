@@ -0,0 +1,207 @@
+"""
+Ways of turning a key event into X input, shared by the bridge and the
+benchmark.
+
+- sendevent: a synthetic KeyPress/KeyRelease sent to the game window with
+  XSendEvent. Works with the window in the background, but the event is
+  flagged as synthetic.
+- xtest: XTEST fake_input, indistinguishable from a real keyboard. It goes
+  to whatever window has the focus, so it only fits a display the game has
+  to itself (the instance's Xephyr).
+- null: counts events and sends nothing (measures the bridge itself).
+
+key() only queues the request; flush() sends everything queued.
+
+XDirectSink puts an injector behind the InputHandler sink interface, so the
+player can skip uinput and the bridge process entirely.
+"""
+
+from abc import ABC, abstractmethod
+
+from Xlib import X, display
+from Xlib.display import Display
+from Xlib.ext import xtest
+from Xlib.protocol import event as xevent
+from Xlib.xobject.drawable import Window
+
+from input_handler import EV_KEY, EV_SYN, SYN_REPORT
+from window_tracker import WindowTracker
+
+INJECTION_BACKENDS = ("sendevent", "xtest", "null")
+
+
+class Injector(ABC):
+    """Queues key events on a display connection; subclasses pick the request."""
+
+    name = ""
+    # Whether key() needs the target window (xtest goes to the focus)
+    needs_window = True
+
+    def __init__(self, d: Display):
+        self.display = d
+        self.sent = 0
+
+    @abstractmethod
+    def key(self, window: Window | None, x_keycode: int, value: int) -> None:
+        """Queues a press (value 1) or release (value 0)."""
+
+    def flush(self) -> None:
+        self.display.flush()
+
+
+class NullInjector(Injector):
+    name = "null"
+    needs_window = False
+
+    def key(self, window: Window | None, x_keycode: int, value: int) -> None:
+        self.sent += 1
+
+    def flush(self) -> None:
+        pass
+
+
+class SendEventInjector(Injector):
+    """
+    XSendEvent to the window. Tracks the modifier keys it pressed so the
+    state field matches, and uses CurrentTime like a real server would
+    stamp it, instead of wall clock seconds.
+    """
+
+    name = "sendevent"
+
+    def __init__(self, d: Display):
+        super().__init__(d)
+        self.root = d.screen().root
+        self.state = 0
+        # X keycode -> modifier bit (Shift, Lock, Control, Mod1-5)
+        self.modifier_bits: dict[int, int] = {}
+        for index, keycodes in enumerate(d.get_modifier_mapping()):
+            for keycode in keycodes:
+                if keycode:
+                    self.modifier_bits[keycode] = 1 << index
+
+    def key(self, window: Window | None, x_keycode: int, value: int) -> None:
+        # needs_window: callers only get here with a window
+        assert window is not None
+        if value == 1:  # Press
+            event_type, mask = xevent.KeyPress, X.KeyPressMask
+        else:  # Release
+            event_type, mask = xevent.KeyRelease, X.KeyReleaseMask
+        # Note: We removed the explicit FocusIn injection here as it might interfere
+        # with the game's actual focus state and block physical input.
+        # Since we target the inner window directly, standard events should work.
+        event_obj = event_type(
+            time=X.CurrentTime,
+            root=self.root.id,
+            window=window.id,
+            same_screen=1,
+            child=X.NONE,
+            root_x=0,
+            root_y=0,
+            event_x=0,
+            event_y=0,
+            # Modifiers held before this event, as the server reports them
+            state=self.state,
+            detail=x_keycode,
+        )
+        window.send_event(event_obj, propagate=False, event_mask=mask)
+        bit = self.modifier_bits.get(x_keycode)
+        if bit:
+            self.state = self.state | bit if value == 1 else self.state & ~bit
+        self.sent += 1
+
+
+class XTestInjector(Injector):
+    """XTEST fake_input. The server delivers it like hardware input, to the focus."""
+
+    name = "xtest"
+    needs_window = False
+
+    def __init__(self, d: Display):
+        super().__init__(d)
+        if not d.has_extension("XTEST"):
+            raise RuntimeError(f"X display {d.get_display_name()} has no XTEST extension")
+
+    def key(self, window: Window | None, x_keycode: int, value: int) -> None:
+        event_type = X.KeyPress if value == 1 else X.KeyRelease
+        xtest.fake_input(self.display, event_type, x_keycode)
+        self.sent += 1
+
+
+def make_injector(backend: str, d: Display) -> Injector:
+    if backend == "sendevent":
+        return SendEventInjector(d)
+    if backend == "xtest":
+        return XTestInjector(d)
+    if backend == "null":
+        return NullInjector(d)
+    raise ValueError(
+        f"Unknown injection backend '{backend}'. Choose from {INJECTION_BACKENDS}."
+    )
+
+
+class XDirectSink:
+    """
+    InputHandler sink that injects into the game window itself.
+
+    Key events are collected until their SYN_REPORT and then sent as one
+    batch with a single flush, like the bridge does for each evdev frame.
+    Only real state changes are forwarded, as the kernel does for a uinput
+    device: a release of a key that is up (release_all(), cleanup()) or a
+    second press of a held key never reaches the game.
+    The window is found and followed with the bridge's WindowTracker; keys
+    that arrive while the game has no window are dropped and counted.
+    InputHandler serializes write() calls under its lock.
+    """
+
+    def __init__(
+        self,
+        target_name: str,
+        display_name: str | None = None,
+        backend: str = "sendevent",
+    ):
+        self.display = display.Display(display_name)
+        try:
+            self.injector = make_injector(backend, self.display)
+            self.tracker = WindowTracker(self.display, target_name)
+        except Exception:
+            self.display.close()
+            raise
+        self.frame: list[tuple[int, int]] = []
+        # Linux keycodes currently down
+        self.pressed: set[int] = set()
+        self.lost = 0
+
+    @property
+    def window(self) -> Window | None:
+        return self.tracker.window
+
+    def write(self, etype: int, code: int, value: int) -> None:
+        if etype == EV_KEY:
+            # Already in that state: the kernel drops these on the uinput path
+            if bool(value) == (code in self.pressed):
+                return
+            if value:
+                self.pressed.add(code)
+            else:
+                self.pressed.discard(code)
+            # Linux input keycode to X11 keycode mapping is usually +8
+            self.frame.append((code + 8, value))
+            return
+        if etype != EV_SYN or code != SYN_REPORT or not self.frame:
+            return
+        # Window changes queued since the last frame (no round trip)
+        self.tracker.process_events()
+        window = self.tracker.window
+        if window is None and self.injector.needs_window:
+            self.lost += len(self.frame)
+        else:
+            for x_keycode, key_value in self.frame:
+                self.injector.key(window, x_keycode, key_value)
+            self.injector.flush()
+        self.frame.clear()
+
+    def close(self) -> None:
+        if self.lost:
+            print(f"X sink: {self.lost} keys dropped while the game had no window.")
+        self.display.close()